@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "google-genai>=1.0.0",
+#     "ddgs>=7.0.0",
+#     "pillow>=10.0.0",
+#     "httpx[http2]>=0.27.0",
+#     "numpy>=1.24",
+# ]
+# ///
+"""
+End-to-end benchmarks for the image skills against local stand-in services.
+
+Usage:
+    uv run --script bench/bench.py                    # every scenario
+    uv run --script bench/bench.py search url --runs 10
+    uv run --script bench/bench.py --latency 0.2 --fail-rate 0.05
+    uv run --script bench/bench.py --list
+
+Each run starts the real script in a fresh process with an empty cache and
+output directory, pointed at mock_services.py, so every network path is
+exercised without API keys or internet access. Per scenario it reports
+p50/p95 wall time, throughput (images saved per second), peak RSS of the
+script process and the bytes exchanged with the stand-in server.
+
+Results are appended to a JSONL history (default
+`~/.cache/claude-skills/bench.jsonl`) together with the git revision and
+the mock settings, and compared with the last stored result for the same
+scenario and settings: a p50 or peak RSS more than `--tolerance` worse is
+reported as a regression and makes the run exit 1.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from mock_services import MockConfig, MockServices, synthetic_image
+
+ROOT = Path(__file__).resolve().parents[1]
+IMAGE_SEARCH = ROOT / "image-search" / "scripts" / "image_search.py"
+GEMINI = ROOT / "nano-banana" / "scripts" / "gemini_imagen.py"
+
+# name -> (script, argv, extra environment); `{input}` is an edit input image
+SCENARIOS = {
+    "search": (IMAGE_SEARCH, ["bench skyline", "-n", "3"],
+               {"SERPAPI_KEY": "bench"}),
+    "search-ddg": (IMAGE_SEARCH, ["bench skyline", "-n", "3"], {}),
+    "logo": (IMAGE_SEARCH, ["--logo", "Bench Corp"], {}),
+    "stock": (IMAGE_SEARCH, ["--stock", "bench office", "-n", "2"],
+              {"UNSPLASH_ACCESS_KEY": "bench", "PEXELS_API_KEY": "bench"}),
+    "url": (IMAGE_SEARCH, ["--url", "{base}/img/bench-direct.jpg",
+                           "bench direct"], {}),
+    "generate": (GEMINI, ["-p", "bench stool", "-n", "2"], {}),
+    "stream": (GEMINI, ["-p", "bench stool", "-n", "2", "--stream"], {}),
+    "edit": (GEMINI, ["-p", "bench edit", "-i", "{input}", "--upload",
+                      "inline"], {}),
+}
+# Enough budget that pacing never kicks in during a benchmark
+QUOTA_ENV = {f"IMAGE_SEARCH_QUOTA_{name}": "1000000/hour"
+             for name in ("SERPAPI", "UNSPLASH", "PEXELS", "LOGODEV")}
+DEFAULT_TOLERANCE = 0.2
+
+
+def default_results_path() -> Path:
+    xdg = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(xdg) / "claude-skills" / "bench.jsonl"
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=ROOT,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linearly interpolated `q`-th percentile (0-100)."""
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_once(argv: list[str], env: dict, workdir: Path) -> dict:
+    """Run one script process; wall time, peak RSS, exit code, images."""
+    out_path, err_path = workdir / "stdout", workdir / "stderr"
+    with open(out_path, "wb") as out, open(err_path, "wb") as err:
+        started = time.perf_counter()
+        proc = subprocess.Popen(argv, cwd=workdir, env=env, stdout=out,
+                                stderr=err, stdin=subprocess.DEVNULL)
+        # wait4 gives this child's own rusage (RUSAGE_CHILDREN would be
+        # the maximum over every run so far)
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - started
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    stdout = out_path.read_text(encoding="utf-8", errors="replace")
+    rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"seconds": elapsed, "rss": rss, "code": proc.returncode,
+            "images": len(re.findall(r"^Saved: ", stdout, re.M)),
+            "stderr": err_path.read_text(encoding="utf-8",
+                                         errors="replace")[-2000:]}
+
+
+def run_scenario(name: str, services: MockServices, runs: int,
+                 edit_input: Path) -> dict:
+    script, args, extra = SCENARIOS[name]
+    argv = [sys.executable, str(script)] + [
+        a.format(base=services.base_url, input=edit_input) for a in args]
+    services.reset()
+    samples, errors = [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+            env = {k: v for k, v in os.environ.items()
+                   if not k.endswith(("_KEY", "_CACHE"))}
+            env.update(services.env())
+            env.update(QUOTA_ENV)
+            env.update({"XDG_CACHE_HOME": str(Path(tmp) / "cache"),
+                        "GEMINI_API_KEY": "bench"})
+            env.update(extra)
+            sample = run_once(argv, env, Path(tmp))
+        if sample["code"] != 0 or not sample["images"]:
+            errors.append(sample["stderr"].strip().splitlines()[-1:]
+                          or [f"exit {sample['code']}"])
+        samples.append(sample)
+    stats = services.stats()
+    times = [s["seconds"] for s in samples]
+    images = sum(s["images"] for s in samples)
+    return {
+        "scenario": name,
+        "runs": runs,
+        "errors": len(errors),
+        "p50": round(percentile(times, 50), 4),
+        "p95": round(percentile(times, 95), 4),
+        "throughput": round(images / sum(times), 3) if sum(times) else 0.0,
+        "rss": max(s["rss"] for s in samples),
+        "bytes_in": stats["bytes_in"],
+        "bytes_out": stats["bytes_out"],
+        "requests": stats["requests"],
+        "first_error": errors[0][0] if errors else None,
+    }
+
+
+def load_history(path: Path) -> list[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return []
+
+
+def regressions(result: dict, history: list[dict],
+                tolerance: float) -> list[str]:
+    """What got worse than the last result for the same scenario/settings."""
+    previous = [h for h in history if h["scenario"] == result["scenario"]
+                and h["config"] == result["config"] and not h["errors"]]
+    if not previous or result["errors"]:
+        return []
+    last = previous[-1]
+    found = []
+    for metric, label in (("p50", "p50"), ("rss", "peak RSS")):
+        if last[metric] and result[metric] > last[metric] * (1 + tolerance):
+            found.append(f"{result['scenario']}: {label} "
+                         f"{result[metric] / last[metric] - 1:+.0%} vs "
+                         f"{last['revision']}")
+    return found
+
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def parse_size(spec: str) -> tuple[int, int]:
+    w, _, h = spec.lower().partition("x")
+    return int(w), int(h)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the image skills against local stand-ins.",
+    )
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"Scenarios to run (default: all of "
+                             f"{', '.join(SCENARIOS)})")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Runs per scenario (default: 5)")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Search/API response delay in seconds "
+                             "(default: 0.05)")
+    parser.add_argument("--image-latency", type=float, default=0.01,
+                        help="Image download delay in seconds (default: 0.01)")
+    parser.add_argument("--gen-latency", type=float, default=0.5,
+                        help="Gemini response delay in seconds (default: 0.5)")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Share of requests answered with 503 (default: 0)")
+    parser.add_argument("--image-size", default="1600x1200",
+                        help="Search result image size (default: 1600x1200)")
+    parser.add_argument("--gen-size", default="1024x1024",
+                        help="Generated image size (default: 1024x1024)")
+    parser.add_argument("--results", default=None,
+                        help="Result history JSONL "
+                             "(default: ~/.cache/claude-skills/bench.jsonl)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Slowdown/growth reported as a regression "
+                             "(default: 0.2)")
+    parser.add_argument("--no-save", action="store_true",
+                        help="Don't append this run to the history")
+    parser.add_argument("--list", action="store_true",
+                        help="List scenarios and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (script, argv, _) in SCENARIOS.items():
+            print(f"{name:12} {script.name} {' '.join(argv)}")
+        return
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    try:
+        config = MockConfig(latency=args.latency,
+                            image_latency=args.image_latency,
+                            gen_latency=args.gen_latency,
+                            fail_rate=args.fail_rate,
+                            image_size=parse_size(args.image_size),
+                            gen_size=parse_size(args.gen_size))
+    except ValueError:
+        parser.error("sizes must look like 1600x1200")
+
+    settings = {"latency": config.latency,
+                "image_latency": config.image_latency,
+                "gen_latency": config.gen_latency,
+                "fail_rate": config.fail_rate,
+                "image_size": list(config.image_size),
+                "gen_size": list(config.gen_size)}
+    results_path = Path(args.results) if args.results else default_results_path()
+    history = load_history(results_path)
+    revision = git_revision()
+
+    services = MockServices(config).start()
+    found = []
+    print(f"{'scenario':12} {'runs':>4} {'p50 s':>7} {'p95 s':>7} "
+          f"{'img/s':>6} {'peak RSS':>9} {'sent':>9} {'recv':>9}")
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+            edit_input = Path(tmp) / "input.jpg"
+            edit_input.write_bytes(
+                synthetic_image("edit-input", config.image_size, "jpeg"))
+            for name in args.scenarios or list(SCENARIOS):
+                print(f"Running {name}...", file=sys.stderr)
+                result = run_scenario(name, services, args.runs, edit_input)
+                result.update({"time": time.time(), "revision": revision,
+                               "config": settings})
+                print(f"{name:12} {result['runs']:>4} {result['p50']:>7.3f} "
+                      f"{result['p95']:>7.3f} {result['throughput']:>6.2f} "
+                      f"{format_bytes(result['rss']):>9} "
+                      f"{format_bytes(result['bytes_out']):>9} "
+                      f"{format_bytes(result['bytes_in']):>9}")
+                if result["errors"]:
+                    print(f"  {result['errors']}/{result['runs']} runs failed: "
+                          f"{result['first_error']}")
+                found += regressions(result, history, args.tolerance)
+                if not args.no_save:
+                    results_path.parent.mkdir(parents=True, exist_ok=True)
+                    with open(results_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(result) + "\n")
+    finally:
+        services.stop()
+
+    if not args.no_save:
+        print(f"\nResults: {results_path} ({revision})")
+    for line in found:
+        print(f"Regression: {line}")
+    if found:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Local stand-ins for every service the image skills talk to.
+
+One threaded HTTP server answers in the formats of SerpAPI, DuckDuckGo
+images, Unsplash, Pexels, Logo.dev, plain image hosts and Gemini's
+`generateContent` / `streamGenerateContent`, with configurable latency,
+failure rate and image sizes. Images are synthetic but distinct per URL
+(smooth random colour fields, so they neither compress to nothing nor count
+as near-duplicates of each other) and are generated once per process.
+
+The scripts are pointed at it with their stand-in environment variables;
+see `MockServices.env()`.
+"""
+
+import base64
+import io
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.05  # seconds before a search/API response
+    image_latency: float = 0.01  # seconds before an image download
+    gen_latency: float = 0.5  # seconds before a Gemini response
+    fail_rate: float = 0.0  # share of requests answered with 503
+    image_size: tuple[int, int] = (1600, 1200)
+    logo_size: tuple[int, int] = (200, 200)
+    gen_size: tuple[int, int] = (1024, 1024)
+    results: int = 10  # search results per query
+
+
+@lru_cache(maxsize=512)
+def synthetic_image(name: str, size: tuple[int, int], fmt: str) -> bytes:
+    """A distinct, photo-like image for `name` (cached)."""
+    from PIL import Image
+
+    rng = random.Random(name)
+    img = Image.frombytes("RGB", (16, 12), rng.randbytes(16 * 12 * 3))
+    img = img.resize(size, Image.Resampling.BICUBIC)
+    buf = io.BytesIO()
+    if fmt == "jpeg":
+        img.save(buf, "JPEG", quality=85)
+    else:
+        img.save(buf, "PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "q"
+
+
+class MockServices:
+    """The stand-in server plus request and byte counters."""
+
+    def __init__(self, config: MockConfig | None = None, port: int = 0):
+        self.config = config or MockConfig()
+        self.lock = threading.Lock()
+        self.reset()
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                services.handle(self, None)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                services.handle(self, self.rfile.read(length))
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "MockServices":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.requests = 0
+            self.failures = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "failures": self.failures,
+                    "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+    def env(self) -> dict[str, str]:
+        """Environment pointing both scripts at this server."""
+        base = self.base_url
+        return {
+            "IMAGE_SEARCH_SERPAPI_URL": f"{base}/serpapi",
+            "IMAGE_SEARCH_DDG_URL": f"{base}/ddg",
+            "IMAGE_SEARCH_UNSPLASH_URL": f"{base}/unsplash",
+            "IMAGE_SEARCH_PEXELS_URL": f"{base}/pexels",
+            "IMAGE_SEARCH_LOGODEV_URL": f"{base}/logodev",
+            "NANO_BANANA_API_URL": base,
+        }
+
+    # --- Responses ---
+
+    def image_url(self, name: str) -> str:
+        return f"{self.base_url}/img/{name}.jpg"
+
+    def search_results(self, query: str, count: int) -> list[tuple[str, int, int]]:
+        w, h = self.config.image_size
+        return [(self.image_url(f"{_slug(query)}-{i}"), w, h)
+                for i in range(min(count, self.config.results))]
+
+    def route(self, path: str, query: dict, body: bytes | None):
+        """(status, content type, body, delay) for one request."""
+        cfg = self.config
+        q = (query.get("q") or query.get("query") or [""])[0]
+        count = int((query.get("num") or query.get("per_page")
+                     or [cfg.results])[0])
+        if path == "/serpapi":
+            results = [{"original": url, "original_width": w,
+                        "original_height": h, "link": url, "thumbnail": url}
+                       for url, w, h in self.search_results(q, count * 3)]
+            return 200, "application/json", json.dumps(
+                {"images_results": results}).encode(), cfg.latency
+        if path == "/ddg":
+            results = [{"image": url, "width": w, "height": h, "url": url,
+                        "thumbnail": url}
+                       for url, w, h in self.search_results(q, cfg.results)]
+            return 200, "application/json", json.dumps(
+                {"results": results}).encode(), cfg.latency
+        if path == "/unsplash":
+            results = [{"width": w, "height": h, "links": {"html": url},
+                        "urls": {"regular": url, "thumb": url}}
+                       for url, w, h in self.search_results(q, count)]
+            return 200, "application/json", json.dumps(
+                {"results": results}).encode(), cfg.latency
+        if path == "/pexels":
+            results = [{"width": w, "height": h, "url": url,
+                        "src": {"large": url, "tiny": url}}
+                       for url, w, h in self.search_results(q, count)]
+            return 200, "application/json", json.dumps(
+                {"photos": results}).encode(), cfg.latency
+        if path.startswith("/logodev/"):
+            data = synthetic_image(path, cfg.logo_size, "png")
+            return 200, "image/png", data, cfg.image_latency
+        if path.startswith("/img/"):
+            data = synthetic_image(path, cfg.image_size, "jpeg")
+            return 200, "image/jpeg", data, cfg.image_latency
+        m = re.fullmatch(r"/v1\w*/models/([^/:]+):(generateContent|"
+                         r"streamGenerateContent)", path)
+        if m and body is not None:
+            return self.gemini(body, m.group(2) == "streamGenerateContent")
+        return 404, "text/plain", b"not found", 0.0
+
+    def gemini(self, body: bytes, stream: bool):
+        name = f"gen-{len(body)}-{random.random()}"
+        data = synthetic_image(name, self.config.gen_size, "png")
+        parts = [{"text": "Here is the image."},
+                 {"inlineData": {"mimeType": "image/png",
+                                 "data": base64.b64encode(data).decode()}}]
+        chunk = {"candidates": [{"content": {"role": "model", "parts": parts},
+                                 "finishReason": "STOP", "index": 0}]}
+        if stream:
+            payload = b"".join(
+                b"data: " + json.dumps({"candidates": [{"content": {
+                    "role": "model", "parts": [part]}, "index": 0}]}).encode()
+                + b"\r\n\r\n" for part in parts)
+            return 200, "text/event-stream", payload, self.config.gen_latency
+        return (200, "application/json", json.dumps(chunk).encode(),
+                self.config.gen_latency)
+
+    def handle(self, req: BaseHTTPRequestHandler, body: bytes | None) -> None:
+        url = urlparse(req.path)
+        fail = random.random() < self.config.fail_rate
+        status, ctype, data, delay = self.route(url.path, parse_qs(url.query),
+                                                body)
+        if delay:
+            time.sleep(delay * random.uniform(0.75, 1.25))
+        if fail:
+            status, ctype, data = 503, "text/plain", b"unavailable"
+        rng = req.headers.get("Range")
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", rng or "")
+        if status == 200 and m and ctype.startswith("image/"):
+            start = int(m.group(1))
+            end = min(int(m.group(2) or len(data) - 1), len(data) - 1)
+            req.send_response(206)
+            req.send_header("Content-Range",
+                            f"bytes {start}-{end}/{len(data)}")
+            data = data[start:end + 1]
+        else:
+            req.send_response(status)
+        req.send_header("Content-Type", ctype)
+        req.send_header("Content-Length", str(len(data)))
+        req.end_headers()
+        try:
+            req.wfile.write(data)
+        except OSError:
+            data = b""  # client hung up (e.g. a header probe)
+        with self.lock:
+            self.requests += 1
+            self.failures += fail
+            self.bytes_in += len(body or b"")
+            self.bytes_out += len(data)
@@ -0,0 +1,289 @@
+"""
+Content-addressed store for downloaded images.
+
+Normalized images are stored once under the SHA-256 of their bytes, and
+output files are reflinked (on filesystems that support it, so they share
+data blocks copy-on-write) or copied from the stored blob. Outputs are never
+hardlinks: a tool rewriting one output in place must not change the blob or
+the same image saved in other documents. Blobs are read-only, and are
+trimmed least-recently-used first once they grow past their size cap.
+
+A URL index remembers which blob each source URL produced along with its
+ETag/Last-Modified validators. Later runs send a conditional request and
+reuse the blob on `304 Not Modified` instead of re-downloading and
+re-encoding it.
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from image_io import file_digest
+from search_cache import cache_dir, connect_db
+
+FICLONE = 0x40049409  # Linux ioctl for reflink copies (btrfs, XFS)
+MAX_BLOB_BYTES = 2 * 1024 * 1024 * 1024
+STALE_TMP = 24 * 3600  # in-flight files older than this were abandoned
+
+
+def _clone(src: Path, dst: Path) -> None:
+    """Reflink `src` to `dst` where supported, else copy it."""
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return
+        except OSError:
+            dst.unlink(missing_ok=True)
+    shutil.copyfile(src, dst)
+
+
+class BlobStore:
+    """Blobs under `<root>/blobs/ab/<sha256>` plus a SQLite URL index.
+
+    With `revalidate=False` the URL index is not consulted, so every URL is
+    fetched in full (content addressing still deduplicates the result).
+    """
+
+    def __init__(self, root: Path | None = None, revalidate: bool = True,
+                 max_bytes: int = MAX_BLOB_BYTES):
+        self.root = root or cache_dir()
+        self.revalidate = revalidate
+        self.max_bytes = max_bytes
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = connect_db(self.root / "blobs.sqlite")
+            conn.execute("""CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                blob TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched REAL NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS outputs (
+                path TEXT PRIMARY KEY,
+                blob TEXT NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS outputs_blob "
+                         "ON outputs (blob)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS phashes (
+                key TEXT PRIMARY KEY,
+                hash INTEGER NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS hosts (
+                host TEXT PRIMARY KEY,
+                ok INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0)""")
+            self._conn = conn
+        return self._conn
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / "blobs" / digest[:2] / digest
+
+    def temp_path(self) -> Path:
+        """A fresh path inside the store for an in-flight download."""
+        tmp = self.root / "tmp"
+        tmp.mkdir(parents=True, exist_ok=True)
+        return tmp / f"{os.getpid()}-{uuid.uuid4().hex}"
+
+    def put_bytes(self, data: bytes) -> str:
+        """Store `data` if new and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{digest}.{os.getpid()}."
+                                 f"{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, path)
+            self.evict()
+        else:
+            self.touch(digest)
+        return digest
+
+    def touch(self, digest: str) -> None:
+        """Mark blob `digest` as recently used."""
+        try:
+            os.utime(self.blob_path(digest))
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """Delete least-recently-used blobs until under `max_bytes`.
+
+        Also sweeps temp files left behind by interrupted runs.
+        """
+        now = time.time()
+        entries = []
+        total = 0
+        for f in (list((self.root / "tmp").glob("*"))
+                  + list((self.root / "blobs").glob("*/.*.tmp"))):
+            try:
+                if now - f.stat().st_mtime > STALE_TMP:
+                    f.unlink()
+            except OSError:
+                continue
+        for f in (self.root / "blobs").glob("*/[0-9a-f]*"):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+        for _, size, f in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+
+    # --- URL index ---
+
+    def lookup(self, url: str) -> dict | None:
+        """Index entry for `url` if its blob is still stored."""
+        if not self.revalidate:
+            return None
+        with self._lock:
+            try:
+                row = self._db().execute(
+                    "SELECT blob, etag, last_modified FROM urls WHERE url = ?",
+                    (url,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None:
+            return None
+        if not self.blob_path(row[0]).exists():  # evicted
+            return None
+        return {"blob": row[0], "etag": row[1], "last_modified": row[2]}
+
+    def conditional_headers(self, entry: dict | None) -> dict:
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record(self, url: str, digest: str, headers) -> None:
+        """Remember that `url` produced `digest`, with its validators."""
+        with self._lock:
+            try:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?)",
+                    (url, digest, headers.get("etag"),
+                     headers.get("last-modified"), time.time()))
+            except sqlite3.Error:
+                pass
+
+    # --- Perceptual hashes ---
+
+    def cached_phash(self, key: str, compute) -> int:
+        """64-bit perceptual hash for `key`, calling `compute()` only once.
+
+        `key` is a blob digest or a `path:mtime:size` file signature.
+        """
+        with self._lock:
+            try:
+                row = self._db().execute(
+                    "SELECT hash FROM phashes WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                row = None
+        if row is not None:
+            return row[0] & 0xFFFFFFFFFFFFFFFF
+        h = compute()
+        signed = h - (1 << 64) if h >= 1 << 63 else h  # SQLite INTEGER is signed
+        with self._lock:
+            try:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO phashes VALUES (?, ?)",
+                    (key, signed))
+            except sqlite3.Error:
+                pass
+        return h
+
+    # --- Host reliability ---
+
+    def record_host(self, host: str, ok: bool) -> None:
+        """Count a finished download from `host` as a success or failure."""
+        col = "ok" if ok else "failed"
+        with self._lock:
+            try:
+                self._db().execute(
+                    f"INSERT INTO hosts (host, {col}) VALUES (?, 1) "
+                    f"ON CONFLICT(host) DO UPDATE SET {col} = {col} + 1",
+                    (host,))
+            except sqlite3.Error:
+                pass
+
+    def host_stats(self, hosts) -> dict[str, tuple[int, int]]:
+        """(ok, failed) download counts for each known host."""
+        hosts = list(set(hosts))
+        if not hosts:
+            return {}
+        with self._lock:
+            try:
+                rows = self._db().execute(
+                    "SELECT host, ok, failed FROM hosts WHERE host IN "
+                    f"({','.join('?' * len(hosts))})", hosts).fetchall()
+            except sqlite3.Error:
+                return {}
+        return {host: (ok, failed) for host, ok, failed in rows}
+
+    # --- Outputs ---
+
+    def existing_output(self, digest: str, directory: Path) -> str | None:
+        """A previously materialized copy of `digest` in `directory`."""
+        with self._lock:
+            try:
+                rows = self._db().execute(
+                    "SELECT path FROM outputs WHERE blob = ?",
+                    (digest,)).fetchall()
+            except sqlite3.Error:
+                return None
+        for (path,) in rows:
+            p = Path(path)
+            if p.parent.resolve() != directory.resolve() or not p.exists():
+                continue
+            if file_digest(p) == digest:
+                return path
+        return None
+
+    def materialize(self, digest: str, output_path: str,
+                    reuse_existing: bool = False) -> str:
+        """Copy blob `digest` to `output_path` and return the final path.
+
+        With `reuse_existing`, an identical image already saved in the same
+        directory (e.g. yesterday's dated filename) is returned instead of
+        creating another entry.
+        """
+        out = Path(output_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        if reuse_existing:
+            existing = self.existing_output(digest, out.parent)
+            if existing:
+                return existing if out.is_absolute() else os.path.relpath(existing)
+        self.touch(digest)
+        # Cloned beside the output and renamed over it, so a failed copy
+        # never leaves a missing or truncated figure
+        tmp = out.with_name(f".{out.name}.{uuid.uuid4().hex}")
+        try:
+            _clone(self.blob_path(digest), tmp)
+            os.replace(tmp, out)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        with self._lock:
+            try:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO outputs VALUES (?, ?)",
+                    (str(out.resolve()), digest))
+            except sqlite3.Error:
+                pass
+        return str(out)
@@ -0,0 +1,206 @@
+"""
+Image search candidates: metadata, header probing and ranking.
+
+Providers already return dimensions, source pages and thumbnails with each
+result. Keeping them lets candidates be ranked before anything is fully
+downloaded; missing dimensions are filled in by fetching just the first few
+KB of the image and reading its header.
+"""
+
+import asyncio
+import math
+import struct
+from dataclasses import asdict, dataclass
+from io import BytesIO
+from urllib.parse import urlparse
+
+IMAGE_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"\x00\x00\x01\x00", "ico"),
+)
+EXTENSION_FORMATS = {
+    ".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg", ".webp": "webp",
+    ".gif": "gif", ".bmp": "bmp", ".tif": "tiff", ".tiff": "tiff",
+    ".svg": "svg", ".ico": "ico", ".avif": "avif",
+}
+# Relative preference for document use. SVG can't be rasterized here.
+FORMAT_SCORES = {"png": 1.0, "jpeg": 1.0, "webp": 0.8, "avif": 0.5,
+                 "bmp": 0.4, "gif": 0.3, "tiff": 0.2, "ico": 0.0,
+                 "svg": -10.0}
+UNKNOWN_FORMAT_SCORE = 0.6
+# Long-edge pixel range that best fits each --size
+SIZE_TARGETS = {None: (800, 4000), "large": (1600, 6000),
+                "medium": (400, 1600), "icon": (32, 256)}
+# Image CDNs that serve hotlinked originals reliably
+RELIABLE_HOSTS = ("upload.wikimedia.org", "images.unsplash.com",
+                  "images.pexels.com", "i.imgur.com", "cdn.pixabay.com")
+PROBE_BYTES = 64 * 1024
+
+
+@dataclass
+class Candidate:
+    """One search result, with whatever metadata the provider returned."""
+
+    url: str
+    width: int | None = None
+    height: int | None = None
+    source: str | None = None
+    thumbnail: str | None = None
+    provider: str | None = None
+
+    @classmethod
+    def from_cached(cls, value) -> "Candidate":
+        """Rebuild from a cache entry (older entries are bare URLs)."""
+        if isinstance(value, str):
+            return cls(url=value)
+        return cls(**value)
+
+    def to_cached(self) -> dict:
+        return asdict(self)
+
+    @property
+    def host(self) -> str:
+        return urlparse(self.url).hostname or ""
+
+    @property
+    def format(self) -> str | None:
+        path = urlparse(self.url).path.lower()
+        for ext, fmt in EXTENSION_FORMATS.items():
+            if path.endswith(ext):
+                return fmt
+        return None
+
+
+def as_int(value) -> int | None:
+    try:
+        return int(value) or None
+    except (TypeError, ValueError):
+        return None
+
+
+def fit_within(w: int | None, h: int | None, max_w: int,
+               max_h: int | None = None) -> tuple[int | None, int | None]:
+    """Dimensions of a `w`x`h` original after a provider's resize."""
+    if not w or not h:
+        return None, None
+    scale = min(1.0, max_w / w, (max_h / h) if max_h else 1.0)
+    return round(w * scale), round(h * scale)
+
+
+# --- Header sniffing ---
+
+def sniff_format(head: bytes) -> str | None:
+    """Identify a raster image format from its first bytes."""
+    for magic, fmt in IMAGE_MAGIC:
+        if head.startswith(magic):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "avif"
+    return None
+
+
+def header_dimensions(head: bytes) -> tuple[int, int] | None:
+    """Image size from a partial download, or None if the header is incomplete."""
+    from PIL import Image as PILImage
+
+    if head.startswith(IMAGE_MAGIC[0][0]) and len(head) >= 24:
+        # PNG IHDR is always first; PIL would wait for the first IDAT
+        return struct.unpack(">II", head[16:24])
+    try:
+        with PILImage.open(BytesIO(head)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+async def probe_dimensions(client, cands: list[Candidate],
+                           concurrency: int = 8, timeout: float = 5) -> None:
+    """Fill in missing width/height by reading only the image header.
+
+    Each probe asks for the first PROBE_BYTES with a Range request and stops
+    reading as soon as the header parses, so servers that ignore Range still
+    only send a few KB before the connection is dropped.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def probe(c: Candidate) -> None:
+        head = b""
+        async with sem:
+            try:
+                async with client.stream(
+                        "GET", c.url, timeout=timeout,
+                        headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"}) as resp:
+                    if resp.status_code not in (200, 206):
+                        return
+                    async for chunk in resp.aiter_bytes():
+                        head += chunk
+                        dims = header_dimensions(head)
+                        if dims or len(head) >= PROBE_BYTES:
+                            break
+            except Exception:
+                return
+        dims = header_dimensions(head) if head else None
+        if dims:
+            c.width, c.height = dims
+
+    await asyncio.gather(*(probe(c) for c in cands
+                           if not (c.width and c.height)))
+
+
+# --- Ranking ---
+
+def parse_aspect(aspect: str | None) -> float | None:
+    """'16:9' -> 1.777..."""
+    if not aspect:
+        return None
+    w, _, h = aspect.partition(":")
+    return float(w) / float(h)
+
+
+def score(c: Candidate, size: str | None = None,
+          aspect: float | None = None,
+          host_stats: dict[str, tuple[int, int]] | None = None) -> float:
+    """Higher is better. Roughly -10..4; only relative order matters."""
+    total = FORMAT_SCORES.get(c.format, UNKNOWN_FORMAT_SCORE)
+
+    if c.width and c.height:
+        lo, hi = SIZE_TARGETS.get(size, SIZE_TARGETS[None])
+        edge = max(c.width, c.height)
+        if edge < lo:
+            total -= math.log2(lo / edge)
+        elif edge > hi:
+            # Too big only costs bandwidth, so penalize gently
+            total -= 0.25 * math.log2(edge / hi)
+        else:
+            total += 1.0
+        ratio = c.width / c.height
+        if aspect:
+            total -= abs(math.log(ratio / aspect))
+        elif max(ratio, 1 / ratio) > 3:
+            total -= 1.0  # banners and strips rarely suit a figure
+
+    if c.host.endswith(RELIABLE_HOSTS):
+        total += 0.5
+    ok, failed = (host_stats or {}).get(c.host, (0, 0))
+    # Laplace-smoothed success rate, centred so unknown hosts score 0
+    total += (ok + 1) / (ok + failed + 2) - 0.5
+    return total
+
+
+def rank_candidates(cands: list[Candidate], size: str | None = None,
+                    aspect: float | None = None,
+                    host_stats: dict[str, tuple[int, int]] | None = None
+                    ) -> list[Candidate]:
+    """Best candidates first; provider order breaks ties."""
+    # Provider relevance still counts for a little
+    keyed = [(score(c, size, aspect, host_stats) - 0.05 * i, i, c)
+             for i, c in enumerate(cands)]
+    return [c for _, _, c in sorted(keyed, key=lambda t: (-t[0], t[1]))]
@@ -0,0 +1,87 @@
+"""
+Perceptual-hash near-duplicate detection.
+
+Each image gets a 64-bit difference hash (dHash) computed from a heavily
+reduced decode: JPEGs are decoded at 1/8 scale via draft mode and other
+formats are shrunk with `reduce()` before the final resize. A new image is
+compared against every hash seen so far in one vectorized NumPy Hamming
+distance, so checking against a directory of hundreds of images is cheap.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+HASH_SIZE = 8
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp"}
+
+
+def dhash(img) -> int:
+    """64-bit dHash of a PIL image (opened lazily for the cheapest decode)."""
+    from PIL import Image as PILImage
+
+    target = HASH_SIZE * 4
+    img.draft("L", (target, target))  # no-op unless JPEG and not yet loaded
+    # reduce() rejects palette, bilevel and 16-bit modes; L it accepts
+    img = img.convert("L")
+    factor = min(img.size) // target
+    if factor > 1:
+        img = img.reduce(factor)
+    small = img.resize((HASH_SIZE + 1, HASH_SIZE),
+                       PILImage.Resampling.BILINEAR)
+    px = np.asarray(small, dtype=np.int16)
+    bits = px[:, 1:] > px[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def dhash_file(path: Path) -> int:
+    from PIL import Image as PILImage
+
+    with PILImage.open(path) as img:
+        return dhash(img)
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0+
+        return np.bitwise_count(x)
+    return np.unpackbits(x.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class HashSet:
+    """Labelled dHashes with a Hamming-distance near-duplicate lookup.
+
+    `threshold` is the number of differing bits (of 64) still treated as
+    the same image.
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.labels: list = []
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def find(self, h: int):
+        """Label of the closest stored hash within the threshold, or None."""
+        if not len(self.hashes):
+            return None
+        dist = _popcount(self.hashes ^ np.uint64(h))
+        best = int(dist.argmin())
+        return self.labels[best] if dist[best] <= self.threshold else None
+
+    def add(self, h: int, label) -> None:
+        self.labels.append(label)
+        self.hashes = np.append(self.hashes, np.uint64(h))
+
+    def remove(self, label) -> None:
+        i = self.labels.index(label)
+        del self.labels[i]
+        self.hashes = np.delete(self.hashes, i)
+
+
+def image_files(directory: Path) -> list[Path]:
+    if not directory.is_dir():
+        return []
+    return [p for p in directory.iterdir()
+            if p.suffix.lower() in IMAGE_SUFFIXES and p.is_file()]
@@ -2,10 +2,10 @@
 # /// script
 # requires-python = ">=3.10"
 # dependencies = [
-#     "serpapi>=0.1.5",
 #     "ddgs>=7.0.0",
 #     "pillow>=10.0.0",
-#     "httpx>=0.27.0",
+#     "httpx[http2]>=0.27.0",
+#     "numpy>=1.24",
 # ]
 # ///
 """
@@ -16,22 +16,63 @@ Usage:
     uv run image_search.py --logo "stripe.com" --typst
     uv run image_search.py --stock "office meeting" --typst
     uv run image_search.py --url "https://example.com/img.png" "example" --typst
+    uv run image_search.py --batch figures.jsonl --typst
 """
 
 import argparse
+import asyncio
+import json
 import os
 import re
 import sys
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import urlparse
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
 
-def slugify(text: str, max_len: int = 40) -> str:
-    """Convert text to a filename-safe slug."""
-    text = text.lower()
-    text = re.sub(r"[^a-z0-9\s-]", "", text)
-    text = re.sub(r"[\s_]+", "-", text).strip("-")
-    return text[:max_len].rstrip("-")
+from blob_store import BlobStore
+from candidates import (Candidate, as_int, fit_within, header_dimensions,
+                        parse_aspect, probe_dimensions, rank_candidates,
+                        sniff_format)
+from image_io import (DEFAULT_DPI, DEFAULT_VARIANTS, EFFORTS, FORMATS,
+                      make_renditions, normalize, parse_widths,
+                      pick_rendition, resolve_output, slugify, suffix_format)
+from logo_index import LogoIndex, load_company_list, logo_key
+from providers import CircuitBreaker, Provider
+from providers import search as run_providers
+from quota import QuotaStore
+from search_cache import SearchCache
+import tracing
+import transport
+
+# Per-download caps (overridable with --max-mb / --max-megapixels)
+DEFAULT_MAX_BYTES = 25 * 1024 * 1024
+DEFAULT_MAX_PIXELS = 50_000_000
+DEFAULT_EFFORT = "default"
+# The settings of the current run, set from the flags by main() (every time:
+# a resident worker runs many jobs in one process). Re-encode settings apply
+# to downloads that aren't already in the output format.
+MAX_BYTES = DEFAULT_MAX_BYTES
+MAX_PIXELS = DEFAULT_MAX_PIXELS
+EFFORT = DEFAULT_EFFORT
+MAX_DIM: int | None = None
+DEFAULT_DUP_THRESHOLD = 6  # differing dHash bits (of 64)
+# Provider endpoints; IMAGE_SEARCH_<NAME>_URL points one at a stand-in server
+PROVIDER_URLS = {
+    "serpapi": "https://serpapi.com/search.json",
+    "unsplash": "https://api.unsplash.com/search/photos",
+    "pexels": "https://api.pexels.com/v1/search",
+    "logodev": "https://img.logo.dev",
+}
+# Download hosts whose requests count against a provider's request budget
+METERED_HOSTS = {"img.logo.dev": "logodev"}
+
+_search_cache: SearchCache | None = None
+_blob_store: BlobStore | None = None
+_breaker: CircuitBreaker | None = None
+_quota: QuotaStore | None = None
+_logo_index: LogoIndex | None = None
 
 
 def auto_filename(query: str, output_dir: str, ext: str = ".png") -> str:
@@ -41,6 +82,21 @@ def auto_filename(query: str, output_dir: str, ext: str = ".png") -> str:
     return str(Path(output_dir) / f"{date}-{slug}{ext}")
 
 
+def numbered_paths(base: str, num: int) -> list[str]:
+    """Output paths for `num` images: `base` itself, or `<stem>_1.png` ..."""
+    if num == 1:
+        return [base]
+    p = Path(base)
+    return [str(p.parent / f"{p.stem}_{i + 1}{p.suffix}") for i in range(num)]
+
+
+def default_output(mode: str, query: str, output_dir: str,
+                   fmt: str | None = None) -> str:
+    """Auto-generated output path of a request without an explicit one."""
+    ext = "-logo.png" if mode == "logo" else ".png"
+    return resolve_output(auto_filename(query, output_dir, ext=ext), fmt)
+
+
 def format_size(path: str) -> str:
     size = Path(path).stat().st_size
     if size >= 1024 * 1024:
@@ -72,141 +128,780 @@ def resolve_domain(company_name: str) -> str:
     return f"{name}.com"
 
 
+def get_http_client():
+    """Process-wide sync client for provider APIs (see transport.py)."""
+    return transport.sync_client()
+
+
+def get_search_cache() -> SearchCache:
+    """Process-wide search cache (configured from CLI flags in main())."""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache()
+    return _search_cache
+
+
+def get_blob_store() -> BlobStore:
+    """Process-wide content-addressed download store."""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore()
+    return _blob_store
+
+
+def get_breaker() -> CircuitBreaker:
+    """Process-wide provider circuit breaker."""
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker()
+    return _breaker
+
+
+def get_logo_index() -> LogoIndex:
+    """Process-wide company -> logo index."""
+    global _logo_index
+    if _logo_index is None:
+        _logo_index = LogoIndex()
+    return _logo_index
+
+
+def get_quota() -> QuotaStore:
+    """Process-wide request budget store."""
+    global _quota
+    if _quota is None:
+        _quota = QuotaStore()
+    return _quota
+
+
+def metered_get(provider: str, url: str, **kwargs):
+    """GET against a metered API: wait for budget, then sync it from headers."""
+    quota = get_quota()
+    quota.acquire(provider)
+    resp = get_http_client().get(url, **kwargs)
+    quota.update(provider, resp.status_code, resp.headers)
+    return resp
+
+
+def cached_search(provider: str, params: dict, fetch) -> list[Candidate]:
+    """Return cached results for `provider` + `params`, else call `fetch()`.
+
+    Empty results are not cached so a transient provider hiccup doesn't
+    stick around for a whole TTL.
+    """
+    cache = get_search_cache()
+    with tracing.span("search", provider=provider) as sp:
+        hit = cache.get(provider, params)
+        sp["cached"] = hit is not None
+        if hit is not None:
+            print(f"Using cached {provider} results", file=sys.stderr)
+            cands = [Candidate.from_cached(v) for v in hit]
+        else:
+            cands = fetch()
+            if cands:
+                cache.put(provider, params, [c.to_cached() for c in cands])
+        sp["results"] = len(cands)
+    return cands
+
+
+def provider_url(name: str) -> str:
+    """API endpoint for `name`; `IMAGE_SEARCH_<NAME>_URL` overrides it."""
+    return os.environ.get(f"IMAGE_SEARCH_{name.upper()}_URL",
+                          PROVIDER_URLS[name])
+
+
+def _serpapi_images(key: str, query: str, num: int, size: str | None,
+                    type_filter: str | None) -> list[Candidate]:
+    params = {
+        "engine": "google_images",
+        "q": query,
+        "num": num * 3,
+        "api_key": key,
+    }
+    if size:
+        size_map = {"large": "l", "medium": "m", "icon": "i"}
+        params["imgsz"] = size_map.get(size, size)
+    if type_filter:
+        type_map = {"photo": "photo", "clipart": "clipart",
+                    "face": "face", "lineart": "lineart"}
+        params["imgtype"] = type_map.get(type_filter, type_filter)
+
+    resp = metered_get("serpapi", provider_url("serpapi"), params=params)
+    results = resp.json()
+    if resp.status_code != 200 or "error" in results:
+        raise RuntimeError(results.get("error") or f"HTTP {resp.status_code}")
+    cands = [Candidate(url=r["original"],
+                       width=as_int(r.get("original_width")),
+                       height=as_int(r.get("original_height")),
+                       source=r.get("link") or r.get("source"),
+                       thumbnail=r.get("thumbnail"), provider="serpapi")
+             for r in results.get("images_results", []) if "original" in r]
+    return cands[:num * 3]
+
+
+def _ddg_images(query: str, num: int) -> list[Candidate]:
+    stand_in = os.environ.get("IMAGE_SEARCH_DDG_URL")
+    if stand_in:
+        # A server answering in DDGS().images() result format (benchmarks)
+        resp = get_http_client().get(stand_in, params={"q": query})
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+        results = resp.json().get("results", [])[:num * 3]
+    else:
+        from duckduckgo_search import DDGS
+        results = DDGS().images(keywords=query, max_results=num * 3)
+    return [Candidate(url=r["image"], width=as_int(r.get("width")),
+                      height=as_int(r.get("height")), source=r.get("url"),
+                      thumbnail=r.get("thumbnail"), provider="ddg")
+            for r in results if "image" in r]
+
+
 def search_images(query: str, num: int = 1, size: str | None = None,
-                  type_filter: str | None = None) -> list[str]:
-    """Search for images. SerpAPI first, DuckDuckGo fallback."""
+                  type_filter: str | None = None,
+                  errors: list | None = None) -> list[Candidate]:
+    """Search for images. SerpAPI first, hedged with DuckDuckGo.
+
+    Providers that failed are appended to `errors` (see `providers.race`).
+    """
+    chain = []
     key = os.environ.get("SERPAPI_KEY")
     if key:
-        try:
-            import serpapi
-            params = {
-                "engine": "google_images",
-                "q": query,
-                "num": num * 3,
-            }
-            if size:
-                size_map = {"large": "l", "medium": "m", "icon": "i"}
-                params["imgsz"] = size_map.get(size, size)
-            if type_filter:
-                type_map = {"photo": "photo", "clipart": "clipart",
-                            "face": "face", "lineart": "lineart"}
-                params["imgtype"] = type_map.get(type_filter, type_filter)
-
-            client = serpapi.Client(api_key=key)
-            results = client.search(params)
-            urls = [r["original"] for r in results.get("images_results", [])
-                    if "original" in r]
-            if urls:
-                return urls[:num * 3]
-        except Exception as e:
-            print(f"SerpAPI failed ({e}), falling back to DuckDuckGo...",
-                  file=sys.stderr)
+        chain.append(Provider("serpapi", lambda: cached_search(
+            "serpapi",
+            {"q": query, "num": num, "size": size, "type": type_filter},
+            lambda: _serpapi_images(key, query, num, size, type_filter)),
+            budget=3.0))
+    chain.append(Provider("ddg", lambda: cached_search(
+        "ddg", {"q": query, "num": num}, lambda: _ddg_images(query, num))))
+    return run_providers(chain, get_breaker(), get_quota(), errors)
 
-    from duckduckgo_search import DDGS
-    results = DDGS().images(keywords=query, max_results=num * 3)
-    return [r["image"] for r in results if "image" in r]
 
+def _unsplash_photos(key: str, query: str, num: int) -> list[Candidate]:
+    resp = metered_get(
+        "unsplash", provider_url("unsplash"),
+        params={"query": query, "per_page": num,
+                "orientation": "landscape"},
+        headers={"Authorization": f"Client-ID {key}"},
+    )
+    if resp.status_code != 200:
+        raise RuntimeError(f"HTTP {resp.status_code}")
+    cands = []
+    for r in resp.json().get("results", []):
+        # `regular` renditions are 1080px wide
+        w, h = fit_within(r.get("width"), r.get("height"), 1080)
+        cands.append(Candidate(url=r["urls"]["regular"], width=w, height=h,
+                               source=r.get("links", {}).get("html"),
+                               thumbnail=r["urls"].get("thumb"),
+                               provider="unsplash"))
+    return cands
+
+
+def _pexels_photos(key: str, query: str, num: int) -> list[Candidate]:
+    resp = metered_get(
+        "pexels", provider_url("pexels"),
+        params={"query": query, "per_page": num},
+        headers={"Authorization": key},
+    )
+    if resp.status_code != 200:
+        raise RuntimeError(f"HTTP {resp.status_code}")
+    cands = []
+    for r in resp.json().get("photos", []):
+        # `large` renditions fit within 940x650
+        w, h = fit_within(r.get("width"), r.get("height"), 940, 650)
+        cands.append(Candidate(url=r["src"]["large"], width=w, height=h,
+                               source=r.get("url"),
+                               thumbnail=r["src"].get("tiny"),
+                               provider="pexels"))
+    return cands
 
-def search_stock(query: str, num: int = 1) -> list[str]:
-    """Search stock photo APIs. Unsplash -> Pexels -> web search fallback."""
-    import httpx
 
+def search_stock(query: str, num: int = 1) -> list[Candidate]:
+    """Search stock photo APIs. Unsplash, Pexels and web search, hedged."""
+    chain = []
     unsplash_key = os.environ.get("UNSPLASH_ACCESS_KEY")
     if unsplash_key:
+        chain.append(Provider("unsplash", lambda: cached_search(
+            "unsplash", {"q": query, "num": num},
+            lambda: _unsplash_photos(unsplash_key, query, num))))
+    pexels_key = os.environ.get("PEXELS_API_KEY")
+    if pexels_key:
+        chain.append(Provider("pexels", lambda: cached_search(
+            "pexels", {"q": query, "num": num},
+            lambda: _pexels_photos(pexels_key, query, num))))
+    if not chain:
+        print("No stock photo API keys found, falling back to web search...",
+              file=sys.stderr)
+        return search_images(f"{query} stock photo", num)
+    # Web search is the last resort; its own chain records its breakers
+    chain.append(Provider(
+        "web", lambda: search_images(f"{query} stock photo", num)))
+    return run_providers(chain, get_breaker(), get_quota())
+
+
+async def rank_for_download(cands: list[Candidate], client,
+                            size: str | None = None,
+                            aspect: str | None = None) -> list[str]:
+    """Probe missing dimensions, rank, and return URLs best-first."""
+    await probe_dimensions(client, cands)
+    stats = await asyncio.to_thread(get_blob_store().host_stats,
+                                    [c.host for c in cands])
+    ranked = rank_candidates(cands, size, parse_aspect(aspect), stats)
+    return [c.url for c in ranked]
+
+
+def logo_url(domain: str) -> str:
+    return f"{provider_url('logodev')}/{domain}?size=200&format=png"
+
+
+def fetch_logo(domain: str, output_path: str,
+               reuse_existing: bool = False) -> str | None:
+    """Fetch logo from Logo.dev. Returns None so callers can fall back."""
+    # Logo.dev serves a tiny placeholder for unknown domains
+    saved = download_candidates([logo_url(domain)], [output_path], 1,
+                                reuse_existing, min_bytes=100)
+    return saved[0] if saved else None
+
+
+class RejectedDownload(Exception):
+    """A candidate was abandoned because it isn't a usable image."""
+
+
+ACCEPTED_CONTENT_TYPES = ("image/", "application/octet-stream",
+                          "binary/octet-stream")
+HEADER_PROBE_BYTES = 256 * 1024
+
+
+def check_response_headers(headers) -> None:
+    """Reject a response from its headers alone, before reading the body."""
+    ctype = headers.get("content-type", "").split(";")[0].strip().lower()
+    if ctype and (not ctype.startswith(ACCEPTED_CONTENT_TYPES)
+                  or ctype == "image/svg+xml"):
+        raise RejectedDownload(f"content-type {ctype}")
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BYTES:
+        raise RejectedDownload(f"{length} bytes exceeds the size cap")
+
+
+async def stream_to_file(resp, path: Path) -> int:
+    """Stream a response body to `path`, enforcing the format and size caps.
+
+    The first bytes are sniffed for a known image signature and the
+    dimensions are read from the image header as soon as it has arrived, so
+    HTML pages, oversized files and huge images are dropped after a few KB
+    instead of after the full transfer. Returns the number of bytes written.
+    """
+    head = b""
+    probing = True
+    total = 0
+    with open(path, "wb") as f:
+        async for chunk in resp.aiter_bytes():
+            total += len(chunk)
+            if total > MAX_BYTES:
+                raise RejectedDownload("body exceeds the size cap")
+            if probing:
+                head += chunk
+                if len(head) >= 16 and sniff_format(head) is None:
+                    raise RejectedDownload("not an image")
+                dims = header_dimensions(head) if len(head) >= 16 else None
+                if dims and dims[0] * dims[1] > MAX_PIXELS:
+                    raise RejectedDownload(
+                        f"{dims[0]}x{dims[1]} exceeds the pixel cap")
+                if dims or len(head) > HEADER_PROBE_BYTES:
+                    probing = False
+                    head = b""
+            f.write(chunk)
+    if probing and sniff_format(head) is None:
+        raise RejectedDownload("not an image")
+    return total
+
+
+def blob_key(url: str, fmt: str) -> str:
+    """Blob store key for `url` normalized to `fmt` with the current settings.
+
+    Plain URLs map to the default (PNG) normalization, so caches written
+    before other formats existed stay valid.
+    """
+    if fmt == "png" and EFFORT == "default" and MAX_DIM is None:
+        return url
+    return f"{url}#{fmt}:{EFFORT}:{MAX_DIM or ''}"
+
+
+def store_file(key: str, path: Path, headers, fmt: str = "png") -> str:
+    """Normalize a downloaded file into the blob store, return digest.
+
+    A download that already is an opaque image in `fmt` is stored as it
+    arrived, without being decoded and re-encoded.
+    """
+    store = get_blob_store()
+    data = normalize(path, fmt, EFFORT, MAX_DIM, max_pixels=MAX_PIXELS,
+                     verify=True)
+    digest = store.put_bytes(data)
+    store.record(key, digest, headers)
+    return digest
+
+
+def blob_phash(digest: str) -> int:
+    from dedup import dhash_file
+
+    store = get_blob_store()
+    return store.cached_phash(digest,
+                              lambda: dhash_file(store.blob_path(digest)))
+
+
+def owned_filenames(query: str, output: str | None):
+    """Predicate for filenames this request itself would produce.
+
+    Earlier runs of the same request (and their `--variants` renditions)
+    aren't "other" images, so they are left out of the near-duplicate check
+    (exact matches are reused instead).
+    """
+    patterns = [rf"\d{{4}}-\d{{2}}-\d{{2}}-{re.escape(slugify(query))}"]
+    if output:
+        patterns.append(re.escape(Path(output).stem))
+    owned = re.compile(
+        rf"(?:{'|'.join(patterns)})(?:_\d+)?(?:@\d+w)?\.(?:png|jpe?g|webp)")
+    return lambda name: owned.fullmatch(name) is not None
+
+
+def existing_hashes(directory: Path, owned, threshold: int):
+    """HashSet of the images already in `directory`, labelled by path."""
+    from dedup import HashSet, dhash_file, image_files
+
+    store = get_blob_store()
+    seen = HashSet(threshold)
+    for p in image_files(directory):
+        if owned(p.name):
+            continue
+        st = p.stat()
         try:
-            resp = httpx.get(
-                "https://api.unsplash.com/search/photos",
-                params={"query": query, "per_page": num,
-                        "orientation": "landscape"},
-                headers={"Authorization": f"Client-ID {unsplash_key}"},
-                timeout=15,
-            )
-            if resp.status_code == 200:
-                urls = [r["urls"]["regular"]
-                        for r in resp.json().get("results", [])]
-                if urls:
-                    return urls
+            h = store.cached_phash(
+                f"{p.resolve()}:{st.st_mtime_ns}:{st.st_size}",
+                lambda: dhash_file(p))
         except Exception as e:
-            print(f"Unsplash failed ({e}), trying Pexels...",
+            print(f"Not checking duplicates against {p}: {e}",
                   file=sys.stderr)
+            continue
+        seen.add(h, p)
+    return seen
 
-    pexels_key = os.environ.get("PEXELS_API_KEY")
-    if pexels_key:
+
+@tracing.profiled
+def download_image(url: str, output_path: str,
+                   reuse_existing: bool = False) -> str | None:
+    """Download image from URL, validate with PIL, normalize format."""
+    saved = download_candidates([url], [output_path], 1, reuse_existing)
+    return saved[0] if saved else None
+
+
+async def _fetch_candidate(client, url: str, min_bytes: int = 0,
+                           fmt: str = "png",
+                           errors: list | None = None) -> dict | None:
+    """Stream one candidate to a temp file, without decoding it.
+
+    Returns `{"digest": ...}` when the stored blob is still current (304),
+    `{"raw": path, "key": ..., "headers": ...}` for a fresh download (the
+    caller normalizes it with `store_candidate` or deletes it), or None.
+    Failures that say nothing about the image (network errors, 429, 5xx)
+    are appended to `errors`.
+    """
+    store = get_blob_store()
+    host = urlparse(url).hostname or ""
+    key = blob_key(url, fmt)
+    metered = METERED_HOSTS.get(host)
+    with tracing.span("candidate", url=url) as sp:
+        tmp = None
         try:
-            resp = httpx.get(
-                "https://api.pexels.com/v1/search",
-                params={"query": query, "per_page": num},
-                headers={"Authorization": pexels_key},
-                timeout=15,
-            )
-            if resp.status_code == 200:
-                urls = [r["src"]["large"]
-                        for r in resp.json().get("photos", [])]
-                if urls:
-                    return urls
+            entry = await asyncio.to_thread(store.lookup, key)
+            if metered:
+                await asyncio.to_thread(get_quota().acquire, metered)
+            async with client.stream(
+                    "GET", url,
+                    headers=store.conditional_headers(entry)) as resp:
+                sp["status"] = resp.status_code
+                if metered:
+                    await asyncio.to_thread(get_quota().update, metered,
+                                            resp.status_code, resp.headers)
+                if resp.status_code == 304 and entry:
+                    sp["result"] = "not modified"
+                    return {"digest": entry["blob"]}
+                if resp.status_code != 200:
+                    sp["result"] = "bad status"
+                    if errors is not None and (resp.status_code == 429
+                                               or resp.status_code >= 500):
+                        errors.append(f"{url}: HTTP {resp.status_code}")
+                    await asyncio.to_thread(store.record_host, host, False)
+                    return None
+                check_response_headers(resp.headers)
+                tmp = store.temp_path()
+                with tracing.span("body", url=url) as body:
+                    body["bytes"] = sp["bytes"] = await stream_to_file(
+                        resp, tmp)
+                if sp["bytes"] <= min_bytes:
+                    sp["result"] = "too small"
+                    tmp.unlink(missing_ok=True)
+                    return None
+            await asyncio.to_thread(store.record_host, host, True)
+            sp["result"] = "downloaded"
+            return {"raw": tmp, "key": key, "headers": dict(resp.headers)}
+        except asyncio.CancelledError:
+            sp["result"] = "cancelled"
+            if tmp is not None:
+                tmp.unlink(missing_ok=True)
+            raise
         except Exception as e:
-            print(f"Pexels failed ({e}), falling back to web search...",
-                  file=sys.stderr)
+            sp["result"] = f"failed: {e}"
+            if tmp is not None:
+                tmp.unlink(missing_ok=True)
+            print(f"Failed to download {url}: {e}", file=sys.stderr)
+            if errors is not None and not isinstance(e, RejectedDownload):
+                errors.append(f"{url}: {e}")
+            await asyncio.to_thread(store.record_host, host, False)
+            return None
 
-    print("No stock photo API keys found, falling back to web search...",
-          file=sys.stderr)
-    return search_images(f"{query} stock photo", num)
 
+def candidate_phash(got: dict) -> int | None:
+    """Perceptual hash of a fetched candidate (None if it doesn't decode)."""
+    from dedup import dhash_file
+
+    try:
+        if "digest" in got:
+            return blob_phash(got["digest"])
+        return dhash_file(got["raw"])
+    except Exception:
+        return None
 
-def fetch_logo(domain: str, output_path: str) -> str | None:
-    """Fetch logo from Logo.dev, fall back to image search."""
-    import httpx
-    from PIL import Image as PILImage
-    from io import BytesIO
 
-    url = f"https://img.logo.dev/{domain}?size=200&format=png"
+def store_candidate(got: dict, fmt: str) -> str:
+    """Blob digest of a fetched candidate, normalizing a fresh download."""
+    if "digest" in got:
+        return got["digest"]
     try:
-        resp = httpx.get(url, timeout=15, follow_redirects=True)
-        if resp.status_code == 200 and len(resp.content) > 100:
-            img = PILImage.open(BytesIO(resp.content))
-            out = Path(output_path)
-            out.parent.mkdir(parents=True, exist_ok=True)
-            if img.mode == "RGBA":
-                rgb = PILImage.new("RGB", img.size, (255, 255, 255))
-                rgb.paste(img, mask=img.split()[3])
-                rgb.save(str(out), "PNG")
-            else:
-                img.convert("RGB").save(str(out), "PNG")
-            return str(out)
-    except Exception as e:
-        print(f"Logo.dev failed ({e}), falling back to image search...",
-              file=sys.stderr)
+        return store_file(got["key"], got["raw"], got["headers"], fmt)
+    finally:
+        got["raw"].unlink(missing_ok=True)
 
-    return None
 
+def new_async_client():
+    """Async download client sharing the transport's pool settings."""
+    return transport.async_client()
 
-def download_image(url: str, output_path: str) -> str | None:
-    """Download image from URL, validate with PIL, normalize format."""
-    import httpx
-    from PIL import Image as PILImage
-    from io import BytesIO
 
-    try:
-        resp = httpx.get(url, timeout=30, follow_redirects=True,
-                         headers={"User-Agent": "Mozilla/5.0"})
-        if resp.status_code != 200:
+async def download_candidates_async(urls: list[str], output_paths: list[str],
+                                    concurrency: int = 4,
+                                    reuse_existing: bool = False,
+                                    client=None,
+                                    min_bytes: int = 0,
+                                    seen=None) -> list[str]:
+    """Download candidates in parallel until `len(output_paths)` are valid.
+
+    Up to `concurrency` downloads run at once. As soon as the best-ranked
+    `len(output_paths)` candidates that decode cleanly are known, the
+    remaining downloads are cancelled. A candidate only wins once every
+    better-ranked one has settled, so `output_paths[0]` gets the best-ranked
+    valid image regardless of which download finished first.
+    Pass `client` to share one connection pool across calls.
+
+    `seen` is an optional `dedup.HashSet` (e.g. of the output directory);
+    candidates perceptually close to anything in it are skipped, and when
+    two candidates match the better-ranked one is kept.
+    """
+    if client is None:
+        async with new_async_client() as own:
+            return await download_candidates_async(
+                urls, output_paths, concurrency, reuse_existing, own,
+                min_bytes, seen)
+
+    digests = await fetch_candidates_async(
+        urls, len(output_paths), suffix_format(output_paths[0]), concurrency,
+        client, min_bytes, seen)
+    store = get_blob_store()
+    return [store.materialize(digest, path, reuse_existing)
+            for path, digest in zip(output_paths, digests)]
+
+
+async def fetch_candidates_async(urls: list[str], num: int, fmt: str,
+                                 concurrency: int, client,
+                                 min_bytes: int = 0,
+                                 seen=None,
+                                 errors: list | None = None) -> list[str]:
+    """Blob digests of the best-ranked `num` valid candidates, in order.
+
+    Downloads run concurrently, but a candidate is only accepted once every
+    better-ranked one has finished (or failed), so the result doesn't depend
+    on which host answered first.
+
+    The download/selection half of `download_candidates_async`, for callers
+    that keep the result in the blob store without writing an output file.
+    Transient download failures are appended to `errors` (see
+    `_fetch_candidate`).
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(idx: int, url: str):
+        async with sem:
+            return idx, await _fetch_candidate(client, url, min_bytes, fmt,
+                                               errors)
+
+    async def store(idx: int, got: dict) -> str | None:
+        try:
+            return await asyncio.to_thread(store_candidate, got, fmt)
+        except Exception as e:
+            print(f"Failed to decode {urls[idx]}: {e}", file=sys.stderr)
             return None
 
-        img = PILImage.open(BytesIO(resp.content))
-        out = Path(output_path)
-        out.parent.mkdir(parents=True, exist_ok=True)
+    downloads = [asyncio.create_task(fetch(i, url))
+                 for i, url in enumerate(urls)]
+    stores: dict[asyncio.Task, int] = {}
+    pending: set[asyncio.Task] = set(downloads)
+    settled: dict[int, dict | None] = {}
+    accepted: set[int] = set()  # being normalized, or done
+    valid: dict[int, str] = {}
+    next_idx = 0
+    try:
+        while True:
+            # Candidate i is only judged once every better-ranked one has
+            # settled, so a fast low-ranked host can't take a better image's
+            # place (and near-duplicates always keep the better-ranked one).
+            # Only accepted candidates are decoded and re-encoded.
+            while next_idx in settled and len(accepted) < num:
+                i, got = next_idx, settled.pop(next_idx)
+                next_idx += 1
+                if got is None:
+                    continue
+                if seen is not None:
+                    # A candidate that can't be hashed is kept unchecked;
+                    # if it doesn't decode at all, storing it fails instead
+                    h = await asyncio.to_thread(candidate_phash, got)
+                    if h is not None and seen.find(h) is not None:
+                        print(f"Skipping near-duplicate {urls[i]}",
+                              file=sys.stderr)
+                        if "raw" in got:
+                            got["raw"].unlink(missing_ok=True)
+                        continue
+                    if h is not None:
+                        seen.add(h, i)
+                accepted.add(i)
+                task = asyncio.create_task(store(i, got))
+                stores[task] = i
+                pending.add(task)
+            if len(valid) >= num or not pending:
+                break
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task in stores:
+                    i = stores.pop(task)
+                    digest = task.result()
+                    # Byte-identical re-hosts of an image we already have
+                    # don't count
+                    if digest is None or digest in valid.values():
+                        accepted.discard(i)
+                        if seen is not None and i in seen.labels:
+                            seen.remove(i)
+                    else:
+                        valid[i] = digest
+                else:
+                    i, got = task.result()
+                    settled[i] = got
+    finally:
+        for t in list(downloads) + list(stores):
+            t.cancel()
+        results = await asyncio.gather(*downloads, *stores,
+                                       return_exceptions=True)
+        # Downloads that were never needed are dropped without decoding
+        for r in results:
+            if isinstance(r, tuple) and r[1] and "raw" in r[1]:
+                r[1]["raw"].unlink(missing_ok=True)
 
-        if img.mode == "RGBA":
-            rgb = PILImage.new("RGB", img.size, (255, 255, 255))
-            rgb.paste(img, mask=img.split()[3])
-            rgb.save(str(out), "PNG")
-        else:
-            img.convert("RGB").save(str(out), "PNG")
+    return [valid[idx] for idx in sorted(valid)]
+
+
+def download_candidates(urls: list[str], output_paths: list[str],
+                        concurrency: int = 4, reuse_existing: bool = False,
+                        min_bytes: int = 0) -> list[str]:
+    """Sync wrapper around `download_candidates_async`."""
+    if not urls or not output_paths:
+        return []
+    return asyncio.run(download_candidates_async(
+        urls, output_paths, concurrency, reuse_existing, min_bytes=min_bytes))
 
-        return str(out)
-    except Exception as e:
-        print(f"Failed to download {url}: {e}", file=sys.stderr)
-        return None
+
+async def resolve_logo(query: str, client, fmt: str = "png",
+                       concurrency: int = 4,
+                       domain: str | None = None) -> tuple[str, str, str]:
+    """(blob digest, domain, source) of the logo for a company or domain.
+
+    Companies in the logo index are answered locally. Otherwise the domain
+    (`domain`, the query itself if it looks like one, or a guess) is tried
+    on Logo.dev, then an image search; a hit goes into the index, and so
+    does a miss when Logo.dev had nothing and the search found no
+    candidates (never after a network or provider failure). Raises
+    RuntimeError when no logo can be found.
+    """
+    index = get_logo_index()
+    key = blob_key(logo_key(query), fmt)
+    entry = await asyncio.to_thread(index.get, key)
+    if entry is not None and (domain is None or entry["domain"] == domain):
+        if entry["digest"] is None:
+            raise RuntimeError("could not find logo (known miss, pass "
+                               "--refresh to retry)")
+        if get_blob_store().blob_path(entry["digest"]).exists():
+            print(f"Using indexed logo for '{query}' ({entry['domain']})",
+                  file=sys.stderr)
+            return entry["digest"], entry["domain"], entry["source"]
+
+    if domain is None:
+        domain = query
+        if "." not in domain:
+            domain = resolve_domain(query)
+            print(f"Resolved '{query}' -> {domain}", file=sys.stderr)
+
+    digests: list[str] = []
+    source = "logodev"
+    # Anything that stopped us from getting a real answer; a miss is only
+    # remembered when there was none
+    errors: list[str] = []
+    if await asyncio.to_thread(get_quota().wait_time, "logodev") > 0:
+        print("Logo.dev request budget exhausted, searching for logo...",
+              file=sys.stderr)
+        errors.append("logodev: no request budget")
+    else:
+        # Logo.dev serves a tiny placeholder for unknown domains
+        digests = await fetch_candidates_async(
+            [logo_url(domain)], 1, fmt, 1, client, min_bytes=100,
+            errors=errors)
+        if not digests:
+            print("Logo.dev failed, searching for logo...", file=sys.stderr)
+    cands = []
+    if not digests:
+        source = "search"
+        cands = await asyncio.to_thread(
+            search_images, f"{query} logo transparent", 1, errors=errors)
+        urls = await rank_for_download(cands, client, "medium")
+        digests = await fetch_candidates_async(urls, 1, fmt, concurrency,
+                                               client)
+    if not digests:
+        if not errors and not cands:
+            await asyncio.to_thread(index.put, key, domain, None, None)
+        raise RuntimeError("could not find logo")
+    await asyncio.to_thread(index.put, key, domain, digests[0], source)
+    return digests[0], domain, source
+
+
+async def run_request(req: dict, client) -> list[str]:
+    """Resolve one request to saved paths, raising RuntimeError on failure.
+
+    `req` holds the same options as the CLI: `mode` (search, logo, stock or
+    url), `query`, `url`, `output`, `dir`, `num`, `size`, `type`, `aspect`,
+    `dup_threshold`, `concurrency` and `format` (plus `domain` to pin a
+    logo's domain).
+    """
+    mode = req.get("mode") or "search"
+    query = req["query"]
+    num = int(req.get("num") or 1)
+    out_dir = req.get("dir") or "images"
+    output = req.get("output")
+    fmt = req.get("format")
+    concurrency = int(req.get("concurrency") or 4)
+    # Auto-named outputs reuse an identical image already in the directory
+    reuse = output is None
+
+    # --- Direct URL mode ---
+    if mode == "url":
+        path = (resolve_output(output, fmt) if output
+                else default_output(mode, query, out_dir, fmt))
+        saved = await download_candidates_async(
+            [req["url"]], [path], 1, reuse, client)
+        if not saved:
+            raise RuntimeError(f"failed to download {req['url']}")
+        return saved
+
+    # --- Logo mode ---
+    if mode == "logo":
+        path = (resolve_output(output, fmt) if output
+                else default_output(mode, query, out_dir, fmt))
+        digest, _, _ = await resolve_logo(query, client, suffix_format(path),
+                                          concurrency, req.get("domain"))
+        return [get_blob_store().materialize(digest, path, reuse)]
+
+    # --- Stock photo mode / default image search ---
+    if mode == "stock":
+        cands = await asyncio.to_thread(search_stock, query, num)
+    elif mode == "search":
+        cands = await asyncio.to_thread(search_images, query, num,
+                                        req.get("size"), req.get("type"))
+    else:
+        raise RuntimeError(f"unknown mode '{mode}'")
+    urls = await rank_for_download(cands, client, req.get("size"),
+                                   req.get("aspect"))
+
+    base = (resolve_output(output, fmt) if output
+            else default_output(mode, query, out_dir, fmt))
+    seen = None
+    threshold = req.get("dup_threshold")
+    threshold = DEFAULT_DUP_THRESHOLD if threshold is None else int(threshold)
+    if threshold > 0:
+        seen = await asyncio.to_thread(
+            existing_hashes, Path(base).parent,
+            owned_filenames(query, output), threshold)
+    # Extra candidates cover downloads that fail, aren't images or are
+    # near-duplicates
+    saved = await download_candidates_async(
+        urls[:num * 3], numbered_paths(base, num), concurrency, reuse, client,
+        seen=seen)
+    if not saved:
+        kind = "stock images" if mode == "stock" else "images"
+        raise RuntimeError(f"no {kind} downloaded")
+    return saved
+
+
+@tracing.profiled
+async def run_single(req: dict) -> list[str]:
+    async with new_async_client() as client:
+        return await run_request(req, client)
+
+
+def load_manifest(path: str) -> list[dict]:
+    """Read a JSONL manifest, skipping blank lines and `#` comments."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{lineno}: {e}") from None
+            if not isinstance(item, dict) or not item.get("query"):
+                raise ValueError(f"{path}:{lineno}: each entry needs a 'query'")
+            items.append(item)
+    return items
+
+
+async def run_batch(items: list[dict], jobs: int = 4) -> list[dict]:
+    """Run manifest items on one shared client, `jobs` at a time.
+
+    Returns one result dict per item, in manifest order.
+    """
+    sem = asyncio.Semaphore(max(1, jobs))
+
+    async def one(idx: int, item: dict, client) -> dict:
+        result = {"index": idx, "mode": item.get("mode") or "search",
+                  "query": item["query"], "ok": False, "paths": [],
+                  "error": None}
+        async with sem:
+            try:
+                result["paths"] = await run_request(item, client)
+                result["ok"] = True
+            except Exception as e:
+                result["error"] = str(e)
+                print(f"[{idx + 1}/{len(items)}] {item['query']}: {e}",
+                      file=sys.stderr)
+        return result
+
+    async with new_async_client() as client:
+        return list(await asyncio.gather(
+            *(one(i, item, client) for i, item in enumerate(items))))
 
 
 def print_typst_code(path: str, width: str, caption: str):
@@ -216,17 +911,226 @@ def print_typst_code(path: str, width: str, caption: str):
 )""")
 
 
+def renditions_for(paths: list[str], args, jobs: int) -> dict:
+    """`--variants` renditions of `paths` (none without the flag)."""
+    if not args.variants or not paths:
+        return {}
+    return make_renditions(paths, parse_widths(args.variants),
+                           args.variants_format, EFFORT, jobs)
+
+
+def print_saved(path: str, variants: dict) -> None:
+    print(f"Saved: {path} ({format_size(path)})")
+    for _, rendition in variants.get(path, []):
+        print(f"Saved: {rendition} ({format_size(rendition)})")
+
+
+def default_caption(query: str) -> str:
+    return slugify(query, 60).replace("-", " ").title()
+
+
+def format_duration(seconds: float) -> str:
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f}h"
+    if seconds >= 60:
+        return f"{seconds / 60:.0f}m"
+    return f"{seconds:.0f}s"
+
+
+def print_quota() -> None:
+    """`--quota`: remaining request budget of each metered provider."""
+    now = datetime.now().timestamp()
+    print(f"{'Provider':<10} {'Budget':>11} {'Server':>13}  Status")
+    for q in get_quota().report():
+        budget = f"{int(q['tokens'])}/{q['capacity']}"
+        server = ("—" if q["remaining"] is None
+                  else f"{q['remaining']}/{q['server_limit'] or '?'}")
+        refill = f"{q['capacity']}/{format_duration(q['window'])}"
+        status = (f"throttled, {format_duration(q['wait'])} left"
+                  if q["wait"] > 0 else f"ok, refills {refill}")
+        if q["synced"]:
+            status += f", synced {format_duration(now - q['synced'])} ago"
+        print(f"{q['name']:<10} {budget:>11} {server:>13}  {status}")
+
+
+async def prefetch_logos(companies: list[tuple[str, str | None]],
+                         jobs: int = 4, fmt: str = "png") -> list[dict]:
+    """Resolve and fetch many logos concurrently over one pooled client."""
+    sem = asyncio.Semaphore(max(1, jobs))
+
+    async def one(name: str, domain: str | None, client) -> dict:
+        async with sem:
+            try:
+                _, domain, source = await resolve_logo(name, client, fmt, 4,
+                                                       domain)
+                return {"company": name, "ok": True, "domain": domain,
+                        "source": source}
+            except Exception as e:
+                return {"company": name, "ok": False, "domain": domain,
+                        "error": str(e)}
+
+    async with new_async_client() as client:
+        return await asyncio.gather(*(one(name, domain, client)
+                                      for name, domain in companies))
+
+
+def main_logo_prefetch(args) -> None:
+    """`--logo-prefetch companies.txt`: fill the logo index in one run."""
+    try:
+        companies = load_company_list(args.logo_prefetch)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    fmt = args.format or "png"
+    results = asyncio.run(prefetch_logos(companies, args.jobs, fmt))
+    for r in results:
+        if r["ok"]:
+            print(f"Indexed: {r['company']} -> {r['domain']} ({r['source']})")
+        else:
+            print(f"Failed: {r['company']} ({r['error']})")
+    failed = sum(not r["ok"] for r in results)
+    print(f"\n{len(results) - failed}/{len(results)} logos indexed")
+    if failed:
+        sys.exit(1)
+
+
+def unique_outputs(items: list[dict]) -> None:
+    """Give auto-named entries that would overwrite each other own paths.
+
+    Entries that share an auto-generated name (the same query in search and
+    stock mode, say) or would land on an explicit `output` of another entry
+    get `-2`, `-3`... suffixes, in manifest order.
+    """
+    def count(item: dict) -> int:
+        if (item.get("mode") or "search") in ("url", "logo"):
+            return 1
+        return int(item.get("num") or 1)
+
+    taken = {p for item in items if item.get("output")
+             for p in numbered_paths(resolve_output(item["output"],
+                                                    item.get("format")),
+                                     count(item))}
+    for item in items:
+        if item.get("output"):
+            continue
+        mode, num = item.get("mode") or "search", count(item)
+        base = default_output(mode, item["query"], item.get("dir") or "images",
+                              item.get("format"))
+        stem, n = Path(base), 2
+        while taken.intersection(numbered_paths(base, num)):
+            base = str(stem.with_name(f"{stem.stem}-{n}{stem.suffix}"))
+            n += 1
+        if base != str(stem):
+            item["output"] = base
+        taken.update(numbered_paths(base, num))
+
+
+def main_batch(args) -> None:
+    """`--batch manifest.jsonl`: run every entry in one process."""
+    defaults = {"dir": args.dir, "num": args.num, "size": args.size,
+                "type": args.type_filter, "aspect": args.aspect,
+                "dup_threshold": args.dup_threshold,
+                "concurrency": args.concurrency, "format": args.format}
+    try:
+        items = [{**defaults, **{k: v for k, v in item.items()
+                                 if v is not None}}
+                 for item in load_manifest(args.batch)]
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    unique_outputs(items)
+
+    results = asyncio.run(run_batch(items, args.jobs))
+
+    results_path = args.results or str(
+        Path(args.batch).with_suffix(".results.jsonl"))
+    with open(results_path, "w", encoding="utf-8") as f:
+        for r in results:
+            f.write(json.dumps(r) + "\n")
+
+    variants = renditions_for([p for r in results for p in r["paths"]],
+                              args, args.jobs)
+    for r in results:
+        if r["ok"]:
+            for p in r["paths"]:
+                print_saved(p, variants)
+        else:
+            print(f"Failed: {r['query']} ({r['error']})")
+
+    if args.typst:
+        print("\nTypst:")
+        for item, r in zip(items, results):
+            width = item.get("width") or args.width
+            for p in r["paths"]:
+                print_typst_code(
+                    pick_rendition(p, variants.get(p, []), width, args.dpi),
+                    width, item.get("caption") or default_caption(
+                        item["query"]))
+
+    failed = sum(not r["ok"] for r in results)
+    print(f"\nResults: {results_path} "
+          f"({len(results) - failed}/{len(results)} ok)")
+    if failed:
+        sys.exit(1)
+
+
+def main_single(args) -> None:
+    """One search/logo/stock/url request from the command line."""
+    mode = ("url" if args.url else "logo" if args.logo
+            else "stock" if args.stock else "search")
+    req = {"mode": mode, "query": args.query, "url": args.url,
+           "output": args.output, "dir": args.dir, "num": args.num,
+           "size": args.size, "type": args.type_filter,
+           "aspect": args.aspect, "dup_threshold": args.dup_threshold,
+           "concurrency": args.concurrency, "format": args.format}
+    try:
+        saved_paths = asyncio.run(run_single(req))
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # --- Output ---
+    variants = renditions_for(saved_paths, args, args.concurrency)
+    for p in saved_paths:
+        print_saved(p, variants)
+
+    if args.typst:
+        print("\nTypst:")
+        for p in saved_paths:
+            caption = args.caption or default_caption(args.query)
+            print_typst_code(
+                pick_rendition(p, variants.get(p, []), args.width, args.dpi),
+                args.width, caption)
+
+
 def main():
+    global _search_cache, _blob_store, _logo_index, _breaker, _quota
+    global MAX_BYTES, MAX_PIXELS, EFFORT, MAX_DIM
     parser = argparse.ArgumentParser(
         description="Search the web for images and download them.",
     )
-    parser.add_argument("query", help="Search terms or company name")
+    parser.add_argument("query", nargs="?",
+                        help="Search terms or company name")
     parser.add_argument("--logo", action="store_true",
                         help="Logo mode — treat query as company/domain")
     parser.add_argument("--stock", action="store_true",
                         help="Stock photo mode — Unsplash/Pexels (license-clear)")
     parser.add_argument("--url", default=None,
                         help="Direct URL download mode")
+    parser.add_argument("--quota", action="store_true",
+                        help="Show the remaining request budget per provider "
+                             "and exit")
+    parser.add_argument("--logo-prefetch", metavar="COMPANIES", default=None,
+                        help="Resolve and cache logos for every company in a "
+                             "text file (one per line, optionally "
+                             "'Name = domain.com')")
+    parser.add_argument("--batch", metavar="MANIFEST", default=None,
+                        help="Run every request in a JSONL manifest")
+    parser.add_argument("--jobs", type=int, default=4,
+                        help="Manifest entries or prefetched logos "
+                             "processed at once (default: 4)")
+    parser.add_argument("--results", default=None,
+                        help="Batch results JSONL (default: <manifest>.results.jsonl)")
     parser.add_argument("--dir", "-d", default="images",
                         help="Output directory (default: images)")
     parser.add_argument("--output", "-o", default=None,
@@ -238,6 +1142,59 @@ def main():
     parser.add_argument("--type", dest="type_filter",
                         choices=["photo", "clipart", "face", "lineart"],
                         help="SerpAPI type filter")
+    parser.add_argument("--aspect", default=None, metavar="W:H",
+                        help="Prefer candidates close to this aspect ratio")
+    parser.add_argument("--dup-threshold", type=int,
+                        default=DEFAULT_DUP_THRESHOLD,
+                        help="Max dHash distance counted as a near-duplicate "
+                             "of a kept or existing image (0 disables)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the search result cache entirely")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore cached search results and re-query")
+    parser.add_argument("--concurrency", "-j", type=int, default=4,
+                        help="Parallel candidate downloads (default: 4)")
+    parser.add_argument("--max-mb", type=float, default=DEFAULT_MAX_BYTES / 2**20,
+                        help="Skip candidates larger than this (default: 25)")
+    parser.add_argument("--max-megapixels", type=float,
+                        default=DEFAULT_MAX_PIXELS / 1e6,
+                        help="Skip candidates with more pixels (default: 50)")
+    parser.add_argument("--format", "-f", choices=list(FORMATS), default=None,
+                        help="Output format (default: from --output suffix, "
+                             "else png)")
+    parser.add_argument("--effort", choices=EFFORTS, default=DEFAULT_EFFORT,
+                        help="Compression effort when a download has to be "
+                             "re-encoded (default: default)")
+    parser.add_argument("--max-dim", type=int, default=None,
+                        help="Downscale saved images to this longest edge")
+    parser.add_argument("--variants", nargs="?", metavar="WIDTHS",
+                        const=",".join(map(str, DEFAULT_VARIANTS)),
+                        default=None,
+                        help="Also write downscaled renditions at these "
+                             "pixel widths (default: 480,960,1920); Typst "
+                             "code uses the smallest one sharp enough")
+    parser.add_argument("--variants-format", choices=list(FORMATS),
+                        default=None,
+                        help="Rendition format (default: same as the image)")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI,
+                        help="Resolution a rendition must reach at --width "
+                             "(default: 150)")
+    parser.add_argument("--connect-timeout", type=float,
+                        default=transport.CONNECT_TIMEOUT,
+                        help="Seconds to wait for a connection (default: 5)")
+    parser.add_argument("--read-timeout", type=float,
+                        default=transport.READ_TIMEOUT,
+                        help="Seconds to wait for response data (default: 30)")
+    parser.add_argument("--retries", type=int, default=transport.RETRIES,
+                        help="Retries for connection errors and 502/503/504 "
+                             "(default: 2)")
+    parser.add_argument("--trace", metavar="PATH", default=None,
+                        help="Write timing spans for every phase to PATH "
+                             "(.json: Chrome trace format, else JSON lines)")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"],
+                        default=None,
+                        help="Profile the download/generation with cProfile "
+                             "or tracemalloc (summary on stderr)")
     parser.add_argument("--typst", action="store_true",
                         help="Print Typst figure code after download")
     parser.add_argument("--width", default="80%",
@@ -246,92 +1203,41 @@ def main():
                         help="Typst caption (auto-generated if omitted)")
     args = parser.parse_args()
 
-    saved_paths: list[str] = []
+    MAX_BYTES = int(args.max_mb * 2**20)
+    MAX_PIXELS = int(args.max_megapixels * 1e6)
+    EFFORT = args.effort
+    MAX_DIM = args.max_dim
+    transport.configure(args.connect_timeout, args.read_timeout, args.retries)
+    _search_cache = SearchCache(read=not (args.no_cache or args.refresh),
+                                write=not args.no_cache)
+    _blob_store = BlobStore(revalidate=not (args.no_cache or args.refresh))
+    _logo_index = LogoIndex(read=not (args.no_cache or args.refresh),
+                            write=not args.no_cache)
+    # Rebuilt on first use, for this run's environment (cache location)
+    _breaker = _quota = None
 
-    # --- Direct URL mode ---
-    if args.url:
-        output_path = args.output or auto_filename(args.query, args.dir)
-        result = download_image(args.url, output_path)
-        if result:
-            saved_paths.append(result)
-        else:
-            print(f"Error: failed to download {args.url}", file=sys.stderr)
-            sys.exit(1)
+    try:
+        parse_aspect(args.aspect)
+    except (ValueError, ZeroDivisionError):
+        parser.error(f"--aspect must look like 16:9, got '{args.aspect}'")
+    if args.variants:
+        try:
+            parse_widths(args.variants)
+        except ValueError:
+            parser.error(f"--variants must look like 480,960, "
+                         f"got '{args.variants}'")
+    if not (args.query or args.quota or args.logo_prefetch or args.batch):
+        parser.error("query is required unless --batch is given")
 
-    # --- Logo mode ---
-    elif args.logo:
-        domain = args.query
-        if "." not in domain:
-            domain = resolve_domain(args.query)
-            print(f"Resolved '{args.query}' -> {domain}", file=sys.stderr)
-
-        output_path = args.output or auto_filename(
-            args.query, args.dir, ext="-logo.png")
-        result = fetch_logo(domain, output_path)
-        if result:
-            saved_paths.append(result)
+    with tracing.session(args.trace, args.profile):
+        if args.quota:
+            print_quota()
+        elif args.logo_prefetch:
+            main_logo_prefetch(args)
+        elif args.batch:
+            main_batch(args)
         else:
-            print(f"Logo.dev failed, searching for logo...", file=sys.stderr)
-            urls = search_images(f"{args.query} logo transparent", num=1)
-            for url in urls:
-                result = download_image(url, output_path)
-                if result:
-                    saved_paths.append(result)
-                    break
-            if not saved_paths:
-                print("Error: could not find logo", file=sys.stderr)
-                sys.exit(1)
-
-    # --- Stock photo mode ---
-    elif args.stock:
-        urls = search_stock(args.query, num=args.num)
-        for i, url in enumerate(urls[:args.num]):
-            if args.num == 1:
-                output_path = args.output or auto_filename(
-                    args.query, args.dir)
-            else:
-                base = args.output or auto_filename(args.query, args.dir)
-                stem = Path(base).stem
-                output_path = str(
-                    Path(base).parent / f"{stem}_{i + 1}.png")
-            result = download_image(url, output_path)
-            if result:
-                saved_paths.append(result)
-        if not saved_paths:
-            print("Error: no stock images downloaded", file=sys.stderr)
-            sys.exit(1)
-
-    # --- Default: image search ---
-    else:
-        urls = search_images(args.query, num=args.num, size=args.size,
-                             type_filter=args.type_filter)
-        for i, url in enumerate(urls[:args.num]):
-            if args.num == 1:
-                output_path = args.output or auto_filename(
-                    args.query, args.dir)
-            else:
-                base = args.output or auto_filename(args.query, args.dir)
-                stem = Path(base).stem
-                output_path = str(
-                    Path(base).parent / f"{stem}_{i + 1}.png")
-            result = download_image(url, output_path)
-            if result:
-                saved_paths.append(result)
-            # Try next URL if download failed
-        if not saved_paths:
-            print("Error: no images downloaded", file=sys.stderr)
-            sys.exit(1)
-
-    # --- Output ---
-    for p in saved_paths:
-        print(f"Saved: {p} ({format_size(p)})")
-
-    if args.typst:
-        print("\nTypst:")
-        for p in saved_paths:
-            caption = args.caption or slugify(
-                args.query, 60).replace("-", " ").title()
-            print_typst_code(p, args.width, caption)
+            main_single(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""
+Persistent company -> domain -> logo index.
+
+Each resolved `--logo` query is remembered with the domain it mapped to, the
+blob store digest of the logo that was found and where it came from
+(Logo.dev or image search), so asking for the same company again is a local
+lookup with no network access at all. Failed lookups are remembered too, for
+a shorter time, so a company without a findable logo fails fast instead of
+paying for a Logo.dev miss and a full search on every run.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from search_cache import cache_dir, connect_db
+
+POSITIVE_TTL = 30 * 24 * 3600
+NEGATIVE_TTL = 6 * 3600
+
+
+def logo_key(name: str) -> str:
+    """Canonical index key for a company name or domain."""
+    return re.sub(r"\s+", " ", name.strip().lower())
+
+
+def load_company_list(path: str) -> list[tuple[str, str | None]]:
+    """Read `(company, domain or None)` pairs, one per line.
+
+    Blank lines and `#` comments are skipped; `Company = domain.com` pins
+    the domain instead of guessing it.
+    """
+    companies = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            name, _, domain = line.partition("=")
+            companies.append((name.strip(), domain.strip() or None))
+    return companies
+
+
+class LogoIndex:
+    """SQLite-backed logo index with separate TTLs for hits and misses.
+
+    `read=False` skips lookups (refresh), `write=False` skips stores.
+    """
+
+    def __init__(self, path: Path | None = None, read: bool = True,
+                 write: bool = True):
+        self.path = path or cache_dir() / "search.sqlite"
+        self.read = read
+        self.write = write
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = connect_db(self.path)
+            conn.execute("""CREATE TABLE IF NOT EXISTS logos (
+                key TEXT PRIMARY KEY,
+                domain TEXT,
+                digest TEXT,
+                source TEXT,
+                checked REAL NOT NULL)""")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> dict | None:
+        """`{"domain", "digest", "source", "checked"}` if still fresh.
+
+        A miss is returned with `digest` None.
+        """
+        if not self.read:
+            return None
+        with self._lock:
+            try:
+                row = self._db().execute(
+                    "SELECT domain, digest, source, checked FROM logos "
+                    "WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None:
+            return None
+        domain, digest, source, checked = row
+        ttl = POSITIVE_TTL if digest else NEGATIVE_TTL
+        if time.time() - checked > ttl:
+            return None
+        return {"domain": domain, "digest": digest, "source": source,
+                "checked": checked}
+
+    def put(self, key: str, domain: str | None, digest: str | None,
+            source: str | None) -> None:
+        if not self.write:
+            return
+        with self._lock:
+            try:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO logos VALUES (?, ?, ?, ?, ?)",
+                    (key, domain, digest, source, time.time()))
+            except sqlite3.Error:
+                pass
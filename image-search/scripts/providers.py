@@ -0,0 +1,213 @@
+"""
+Search provider scheduling: hedged requests and a persistent circuit breaker.
+
+A provider chain (e.g. SerpAPI then DuckDuckGo) is raced rather than walked:
+the first provider starts alone, and if it hasn't answered within its latency
+budget, or it fails, the next one starts alongside it. The first non-empty
+result wins and the slower requests are abandoned. Provider calls are
+blocking library/HTTP calls, so each runs on a daemon thread that an
+abandoned request simply leaves to finish (or die with the process) instead
+of holding up the exit.
+
+Every finished call is recorded in a circuit breaker kept in the search
+cache database: after `FAILURE_THRESHOLD` consecutive failures a provider is
+skipped, across invocations, until its cooldown expires, and each further
+failure doubles the cooldown up to `MAX_COOLDOWN`. Providers that are out of
+request budget (see quota.py) are moved behind those that still have some.
+"""
+
+import asyncio
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import tracing
+from search_cache import cache_dir, connect_db
+
+HEDGE_DELAY = 2.0  # default latency budget before the next provider starts
+FAILURE_THRESHOLD = 3
+COOLDOWN = 300
+MAX_COOLDOWN = 3600
+
+
+@dataclass
+class Provider:
+    """One link in a provider chain; `fetch` blocks and returns results."""
+
+    name: str
+    fetch: Callable[[], list]
+    budget: float = HEDGE_DELAY
+
+
+class CircuitBreaker:
+    """Consecutive-failure counts and cooldowns per provider, on disk."""
+
+    def __init__(self, path: Path | None = None,
+                 threshold: int = FAILURE_THRESHOLD,
+                 cooldown: float = COOLDOWN,
+                 max_cooldown: float = MAX_COOLDOWN):
+        self.path = path or cache_dir() / "search.sqlite"
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = connect_db(self.path)
+            conn.execute("""CREATE TABLE IF NOT EXISTS breakers (
+                provider TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                open_until REAL NOT NULL)""")
+            self._conn = conn
+        return self._conn
+
+    def open_until(self, name: str) -> float | None:
+        """When `name` may be tried again, or None if it isn't tripped."""
+        with self._lock:
+            try:
+                row = self._db().execute(
+                    "SELECT open_until FROM breakers WHERE provider = ?",
+                    (name,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None or row[0] <= time.time():
+            return None
+        return row[0]
+
+    def record(self, name: str, ok: bool) -> None:
+        with self._lock:
+            try:
+                db = self._db()
+                if ok:
+                    db.execute("DELETE FROM breakers WHERE provider = ?",
+                               (name,))
+                    return
+                row = db.execute(
+                    "SELECT failures FROM breakers WHERE provider = ?",
+                    (name,)).fetchone()
+                failures = (row[0] if row else 0) + 1
+                open_until = 0.0
+                if failures >= self.threshold:
+                    cooldown = min(self.cooldown
+                                   * 2 ** (failures - self.threshold),
+                                   self.max_cooldown)
+                    open_until = time.time() + cooldown
+                db.execute("INSERT OR REPLACE INTO breakers "
+                           "VALUES (?, ?, ?)", (name, failures, open_until))
+            except sqlite3.Error:
+                pass
+
+
+def _start(provider: Provider, breaker: CircuitBreaker | None):
+    """Run `provider.fetch` on a daemon thread; returns an asyncio future."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+
+    def settle(result, exc):
+        if fut.done():
+            return
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(result)
+
+    def run():
+        result, exc = None, None
+        try:
+            with tracing.span("provider", provider=provider.name) as sp:
+                result = provider.fetch()
+                sp["results"] = len(result or [])
+        except Exception as e:
+            exc = e
+        if breaker is not None:
+            breaker.record(provider.name, exc is None)
+        try:
+            loop.call_soon_threadsafe(settle, result, exc)
+        except RuntimeError:
+            pass  # abandoned: the race is over and its loop closed
+
+    threading.Thread(target=run, daemon=True,
+                     name=f"provider-{provider.name}").start()
+    return fut
+
+
+async def race(providers: list[Provider],
+               breaker: CircuitBreaker | None = None, quota=None,
+               errors: list | None = None) -> list:
+    """First non-empty result of a hedged run over `providers`, else [].
+
+    `quota` is an optional `quota.QuotaStore`; throttled providers are only
+    tried after the ones with budget left, soonest-available first. Pass an
+    `errors` list to tell "nothing found" apart from "couldn't ask": every
+    provider that failed or was skipped is appended to it.
+    """
+    queue = list(providers)
+    if breaker is not None:
+        available = []
+        for p in providers:
+            until = breaker.open_until(p.name)
+            if until is None:
+                available.append(p)
+            else:
+                print(f"Skipping {p.name} (failing, retry in "
+                      f"{until - time.time():.0f}s)", file=sys.stderr)
+        # With every provider tripped, trying them beats returning nothing
+        queue = available or list(providers)
+        if errors is not None:
+            errors += [f"{p.name}: skipped" for p in providers
+                       if p not in queue]
+    if quota is not None:
+        waits = {p.name: quota.wait_time(p.name) for p in queue}
+        for p in queue:
+            if waits[p.name] > 0:
+                print(f"Deferring {p.name} (no request budget for "
+                      f"{waits[p.name]:.0f}s)", file=sys.stderr)
+        queue.sort(key=lambda p: waits[p.name])  # stable: order kept otherwise
+
+    running: dict = {}  # future -> Provider
+    order = {p.name: i for i, p in enumerate(providers)}
+
+    def launch() -> Provider:
+        p = queue.pop(0)
+        running[_start(p, breaker)] = p
+        return p
+
+    current = launch()
+    try:
+        while running:
+            timeout = current.budget if queue else None
+            done, _ = await asyncio.wait(running, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"{current.name} is slow, also trying "
+                      f"{queue[0].name}...", file=sys.stderr)
+                current = launch()
+                continue
+            for fut in sorted(done, key=lambda f: order[running[f].name]):
+                p = running.pop(fut)
+                if fut.exception() is not None:
+                    print(f"{p.name} failed ({fut.exception()})",
+                          file=sys.stderr)
+                    if errors is not None:
+                        errors.append(f"{p.name}: {fut.exception()}")
+                elif fut.result():
+                    return fut.result()
+            if queue and all(r is not current for r in running.values()):
+                # The newest request finished without a result: move on now
+                current = launch()
+        return []
+    finally:
+        for fut in running:
+            fut.cancel()
+
+
+def search(providers: list[Provider], breaker: CircuitBreaker | None = None,
+           quota=None, errors: list | None = None) -> list:
+    """Blocking wrapper around `race`."""
+    return asyncio.run(race(providers, breaker, quota, errors))
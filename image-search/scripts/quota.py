@@ -0,0 +1,233 @@
+"""
+Cross-process request budgets for metered search APIs.
+
+Each metered provider has a token bucket (capacity and refill rate from
+`QUOTA_DEFAULTS`, or `IMAGE_SEARCH_QUOTA_<NAME>="50/hour"`) kept in the
+search cache database, so parallel document builds sharing one API key draw
+from the same budget. Responses keep the buckets honest: `X-Ratelimit-
+Remaining`/`-Limit`/`-Reset` headers cap the local count at what the server
+reports, and a 429 empties the bucket until `Retry-After`. Taking a token
+happens in an immediate SQLite transaction; when the bucket is empty the
+caller sleeps until it refills instead of sending a request that would fail.
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from search_cache import cache_dir, connect_db
+
+# provider -> (capacity, seconds to refill it completely)
+QUOTA_DEFAULTS = {
+    "serpapi": (100, 3600),
+    "unsplash": (50, 3600),  # demo keys
+    "pexels": (200, 3600),
+    "logodev": (1000, 3600),
+}
+WINDOWS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400,
+           "month": 30 * 86400}
+MAX_QUOTA_WAIT = 300  # past this, send the request and let the server decide
+DEFAULT_RETRY_AFTER = 60
+
+
+def parse_rate(spec: str) -> tuple[int, int]:
+    """`"50/hour"` -> (50, 3600)."""
+    count, _, window = spec.partition("/")
+    return int(count), WINDOWS[window.strip().lower() or "hour"]
+
+
+def _header_int(headers, name: str) -> int | None:
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+class QuotaStore:
+    """Token buckets per provider plus the last server-reported limits."""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or cache_dir() / "search.sqlite"
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = connect_db(self.path)
+            conn.execute("""CREATE TABLE IF NOT EXISTS quotas (
+                provider TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                remaining INTEGER,
+                server_limit INTEGER,
+                reset REAL,
+                blocked_until REAL NOT NULL DEFAULT 0,
+                synced REAL)""")
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        """Immediate (write-locked) transaction shared with other processes."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def rate(self, name: str) -> tuple[int, int] | None:
+        """(capacity, window seconds) for a metered provider, else None."""
+        spec = os.environ.get(f"IMAGE_SEARCH_QUOTA_{name.upper()}")
+        if spec:
+            try:
+                return parse_rate(spec)
+            except (ValueError, KeyError):
+                print(f"Ignoring bad IMAGE_SEARCH_QUOTA_{name.upper()}="
+                      f"'{spec}'", file=sys.stderr)
+        return QUOTA_DEFAULTS.get(name)
+
+    def _state(self, db, name: str, now: float) -> dict:
+        """Bucket state for `name` with refill applied up to `now`."""
+        capacity, window = self.rate(name)
+        row = db.execute(
+            "SELECT tokens, updated, remaining, server_limit, reset, "
+            "blocked_until, synced FROM quotas WHERE provider = ?",
+            (name,)).fetchone()
+        if row is None:
+            return {"tokens": float(capacity), "remaining": None,
+                    "server_limit": None, "reset": None, "blocked_until": 0.0,
+                    "synced": None, "capacity": capacity, "window": window}
+        tokens, updated, remaining, limit, reset, blocked, synced = row
+        tokens = min(capacity, tokens + (now - updated) * capacity / window)
+        if reset is not None and now >= reset:
+            # The server's window rolled over: its budget is back in full
+            remaining = reset = None
+            tokens = float(capacity)
+        return {"tokens": tokens, "remaining": remaining,
+                "server_limit": limit, "reset": reset,
+                "blocked_until": blocked, "synced": synced,
+                "capacity": capacity, "window": window}
+
+    def _save(self, db, name: str, state: dict, now: float) -> None:
+        db.execute("INSERT OR REPLACE INTO quotas VALUES (?, ?, ?, ?, ?, ?, "
+                   "?, ?)", (name, state["tokens"], now, state["remaining"],
+                             state["server_limit"], state["reset"],
+                             state["blocked_until"], state["synced"]))
+
+    @staticmethod
+    def _wait(state: dict, now: float) -> float:
+        wait = 0.0
+        if state["tokens"] < 1:
+            wait = (1 - state["tokens"]) * state["window"] / state["capacity"]
+        if state["remaining"] == 0 and state["reset"]:
+            wait = max(wait, state["reset"] - now)
+        return max(wait, state["blocked_until"] - now)
+
+    def wait_time(self, name: str) -> float:
+        """Seconds until `name` has budget for a request (0 if unmetered)."""
+        if self.rate(name) is None:
+            return 0.0
+        with self._lock:
+            try:
+                now = time.time()
+                return self._wait(self._state(self._db(), name, now), now)
+            except sqlite3.Error:
+                return 0.0
+
+    def _try_take(self, name: str) -> float:
+        """Take a token if one is available; else the seconds to wait."""
+        with self._transaction() as db:
+            now = time.time()
+            state = self._state(db, name, now)
+            wait = self._wait(state, now)
+            if wait <= 0:
+                state["tokens"] -= 1
+                if state["remaining"]:
+                    state["remaining"] -= 1
+                self._save(db, name, state, now)
+        return wait
+
+    def acquire(self, name: str, max_wait: float = MAX_QUOTA_WAIT) -> None:
+        """Block until `name` has budget for one request, then spend it.
+
+        Gives up waiting after `max_wait` seconds and lets the request go
+        out anyway; the server's answer then updates the bucket.
+        """
+        if self.rate(name) is None:
+            return
+        deadline = time.time() + max_wait
+        while True:
+            try:
+                wait = self._try_take(name)
+            except sqlite3.Error:
+                return
+            if wait <= 0:
+                return
+            wait = min(wait, deadline - time.time())
+            if wait <= 0:
+                print(f"{name} still throttled, sending anyway...",
+                      file=sys.stderr)
+                return
+            print(f"{name} request budget exhausted, waiting {wait:.1f}s...",
+                  file=sys.stderr)
+            time.sleep(wait)
+
+    def update(self, name: str, status: int, headers) -> None:
+        """Sync the bucket with a response's rate-limit headers."""
+        if self.rate(name) is None:
+            return
+        remaining = _header_int(headers, "x-ratelimit-remaining")
+        limit = _header_int(headers, "x-ratelimit-limit")
+        reset = _header_int(headers, "x-ratelimit-reset")
+        retry_after = _header_int(headers, "retry-after")
+        if status != 429 and remaining is None and limit is None:
+            return
+        try:
+            with self._transaction() as db:
+                now = time.time()
+                state = self._state(db, name, now)
+                if remaining is not None:
+                    state["remaining"] = remaining
+                    state["tokens"] = min(state["tokens"], remaining)
+                if limit is not None:
+                    state["server_limit"] = limit
+                if reset is not None:
+                    # Either an epoch timestamp or seconds from now
+                    state["reset"] = reset if reset > 1e9 else now + reset
+                if status == 429:
+                    state["tokens"] = 0.0
+                    state["blocked_until"] = now + (
+                        retry_after if retry_after is not None
+                        else DEFAULT_RETRY_AFTER)
+                state["synced"] = now
+                self._save(db, name, state, now)
+        except sqlite3.Error:
+            pass
+
+    def report(self) -> list[dict]:
+        """Current budget of every metered provider, for `--quota`."""
+        rows = []
+        with self._lock:
+            try:
+                db = self._db()
+                now = time.time()
+                names = set(QUOTA_DEFAULTS) | {r[0] for r in db.execute(
+                    "SELECT provider FROM quotas")}
+                for name in sorted(names):
+                    if self.rate(name) is None:
+                        continue
+                    state = self._state(db, name, now)
+                    state["name"] = name
+                    state["wait"] = self._wait(state, now)
+                    rows.append(state)
+            except sqlite3.Error:
+                pass
+        return rows
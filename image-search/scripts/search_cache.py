@@ -0,0 +1,138 @@
+"""
+Persistent on-disk cache for image search results.
+
+Results are keyed by provider, query and filters and stored in a small
+SQLite database under the user cache directory. SQLite's file locking makes
+the cache safe to share between parallel `image_search.py` invocations.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Seconds a cached result stays fresh, per provider
+PROVIDER_TTLS = {
+    "serpapi": 7 * 24 * 3600,
+    "ddg": 24 * 3600,
+    "unsplash": 3 * 24 * 3600,
+    "pexels": 3 * 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+MAX_ENTRIES = 2000
+
+
+def cache_dir() -> Path:
+    """Root cache directory (`$IMAGE_SEARCH_CACHE` or XDG cache)."""
+    override = os.environ.get("IMAGE_SEARCH_CACHE")
+    if override:
+        return Path(override)
+    xdg = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(xdg) / "claude-skills" / "image-search"
+
+
+def connect_db(path: Path) -> sqlite3.Connection:
+    """Open a WAL-mode SQLite database in autocommit mode."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=10, isolation_level=None,
+                           check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def cache_key(provider: str, params: dict) -> str:
+    """Canonical hash of provider + params (key order doesn't matter)."""
+    blob = json.dumps([provider, params], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class SearchCache:
+    """SQLite-backed result cache with per-provider TTL and LRU eviction.
+
+    `read=False` skips lookups (refresh), `write=False` skips stores; with
+    both off the cache never touches disk.
+    """
+
+    def __init__(self, path: Path | None = None, read: bool = True,
+                 write: bool = True, max_entries: int = MAX_ENTRIES):
+        self.path = path or cache_dir() / "search.sqlite"
+        self.read = read
+        self.write = write
+        self.max_entries = max_entries
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = connect_db(self.path)
+            conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_lru "
+                         "ON results (last_used)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, provider: str, params: dict):
+        """Return the cached value, or None if missing, stale or disabled."""
+        if not self.read:
+            return None
+        key = cache_key(provider, params)
+        with self._lock:
+            return self._get(provider, key)
+
+    def _get(self, provider: str, key: str):
+        try:
+            db = self._db()
+            row = db.execute("SELECT value, created FROM results WHERE key = ?",
+                             (key,)).fetchone()
+            if row is None:
+                return None
+            ttl = PROVIDER_TTLS.get(provider, DEFAULT_TTL)
+            now = time.time()
+            if now - row[1] > ttl:
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE results SET last_used = ? WHERE key = ?",
+                       (now, key))
+            return json.loads(row[0])
+        except sqlite3.Error:
+            return None
+
+    def put(self, provider: str, params: dict, value) -> None:
+        """Store `value` (JSON-serializable) and evict least-recently-used."""
+        if not self.write:
+            return
+        now = time.time()
+        with self._lock:
+            self._put(provider, cache_key(provider, params), value, now)
+
+    def _put(self, provider: str, key: str, value, now: float) -> None:
+        try:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (key, provider, json.dumps(value), now, now))
+                db.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results "
+                    "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            pass
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,313 @@
+"""
+Shared HTTP transport for search providers and downloads.
+
+Everything that talks HTTP in image-search goes through one process-wide
+sync client (provider APIs) or async clients built the same way (downloads,
+probes), so connections are pooled per host and kept alive between calls,
+HTTP/2 is negotiated when the `h2` package is installed (several images from
+one CDN then share a single multiplexed connection), and hostnames are
+resolved once per `DNS_TTL` rather than on every new connection.
+
+Transient failures (connection errors, timeouts, 502/503/504) are retried
+with full-jitter exponential backoff for idempotent requests. 429 is left to
+the caller: quota.py and the provider race route around it instead.
+"""
+
+import asyncio
+import importlib.util
+import ipaddress
+import random
+import socket
+import threading
+import time
+
+import tracing
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+# Defaults for --connect-timeout / --read-timeout / --retries (configure())
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+RETRIES = 2
+RETRY_STATUSES = {502, 503, 504}
+RETRY_BASE = 0.25
+RETRY_CAP = 4.0
+DNS_TTL = 300
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE = 32
+KEEPALIVE_EXPIRY = 30.0
+
+_settings = {"connect_timeout": CONNECT_TIMEOUT,
+             "read_timeout": READ_TIMEOUT, "retries": RETRIES}
+_sync_client = None
+_client_lock = threading.Lock()
+_dns_cache: dict[tuple[str, int], tuple[float, list[str]]] = {}
+_dns_lock = threading.Lock()
+
+
+def configure(connect_timeout: float = CONNECT_TIMEOUT,
+              read_timeout: float = READ_TIMEOUT,
+              retries: int = RETRIES) -> None:
+    """Set timeouts and retries for clients created from now on.
+
+    The shared sync client is rebuilt if the settings changed (a resident
+    worker runs jobs with different flags in one process).
+    """
+    global _sync_client
+    settings = {"connect_timeout": connect_timeout,
+                "read_timeout": read_timeout, "retries": retries}
+    with _client_lock:
+        if settings != _settings:
+            _settings.update(settings)
+            _sync_client = None
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (0-based)."""
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+# --- DNS cache ---
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def _cached_addresses(host: str, port: int) -> list[str] | None:
+    with _dns_lock:
+        entry = _dns_cache.get((host, port))
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def _store_addresses(host: str, port: int, infos) -> list[str]:
+    addrs = list(dict.fromkeys(info[4][0] for info in infos))
+    with _dns_lock:
+        _dns_cache[(host, port)] = (time.monotonic() + DNS_TTL, addrs)
+    return addrs
+
+
+def resolve(host: str, port: int) -> list[str]:
+    if _is_ip(host):
+        return [host]
+    cached = _cached_addresses(host, port)
+    if cached is not None:
+        return cached
+    with tracing.span("dns", host=host):
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return _store_addresses(host, port, infos)
+
+
+async def resolve_async(host: str, port: int) -> list[str]:
+    if _is_ip(host):
+        return [host]
+    cached = _cached_addresses(host, port)
+    if cached is not None:
+        return cached
+    with tracing.span("dns", host=host):
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM)
+    return _store_addresses(host, port, infos)
+
+
+def _backends():
+    """DNS-caching wrappers around httpcore's sync and async backends."""
+    import httpcore
+
+    class CachingBackend(httpcore.NetworkBackend):
+        def __init__(self, inner):
+            self.inner = inner
+
+        def connect_tcp(self, host, port, timeout=None, local_address=None,
+                        socket_options=None):
+            try:
+                addrs = resolve(host, port)
+            except OSError as e:
+                raise httpcore.ConnectError(str(e)) from e
+            for i, addr in enumerate(addrs):
+                try:
+                    return self.inner.connect_tcp(addr, port, timeout,
+                                                  local_address,
+                                                  socket_options)
+                except httpcore.ConnectError:
+                    if i == len(addrs) - 1:
+                        raise
+
+        def connect_unix_socket(self, path, timeout=None,
+                                socket_options=None):
+            return self.inner.connect_unix_socket(path, timeout,
+                                                  socket_options)
+
+        def sleep(self, seconds):
+            self.inner.sleep(seconds)
+
+    class AsyncCachingBackend(httpcore.AsyncNetworkBackend):
+        def __init__(self, inner):
+            self.inner = inner
+
+        async def connect_tcp(self, host, port, timeout=None,
+                              local_address=None, socket_options=None):
+            try:
+                addrs = await resolve_async(host, port)
+            except OSError as e:
+                raise httpcore.ConnectError(str(e)) from e
+            for i, addr in enumerate(addrs):
+                try:
+                    return await self.inner.connect_tcp(
+                        addr, port, timeout, local_address, socket_options)
+                except httpcore.ConnectError:
+                    if i == len(addrs) - 1:
+                        raise
+
+        async def connect_unix_socket(self, path, timeout=None,
+                                      socket_options=None):
+            return await self.inner.connect_unix_socket(path, timeout,
+                                                        socket_options)
+
+        async def sleep(self, seconds):
+            await self.inner.sleep(seconds)
+
+    return CachingBackend, AsyncCachingBackend
+
+
+def _install_dns_cache(transport, wrapper) -> None:
+    # httpx doesn't expose the backend; skip quietly if its internals change
+    pool = getattr(transport, "_pool", None)
+    if pool is not None and hasattr(pool, "_network_backend"):
+        pool._network_backend = wrapper(pool._network_backend)
+
+
+# --- Retrying transports ---
+
+def _retryable_request(request) -> bool:
+    return request.method in ("GET", "HEAD", "OPTIONS")
+
+
+def _add_trace(request, is_async: bool) -> None:
+    """Report connect/TLS/transfer phases of `request` when tracing."""
+    hook = tracing.http_trace_extension(str(request.url), is_async)
+    if hook is not None:
+        request.extensions = {**request.extensions, "trace": hook}
+
+
+def _transports():
+    import httpx
+
+    class RetryTransport(httpx.BaseTransport):
+        def __init__(self, inner, retries: int):
+            self.inner = inner
+            self.retries = retries
+
+        def handle_request(self, request):
+            _add_trace(request, is_async=False)
+            attempt = 0
+            while True:
+                last = attempt >= self.retries or not _retryable_request(
+                    request)
+                try:
+                    resp = self.inner.handle_request(request)
+                except (httpx.ConnectError, httpx.ConnectTimeout,
+                        httpx.ReadTimeout, httpx.RemoteProtocolError):
+                    if last:
+                        raise
+                else:
+                    if last or resp.status_code not in RETRY_STATUSES:
+                        return resp
+                    resp.close()
+                time.sleep(backoff(attempt))
+                attempt += 1
+
+        def close(self):
+            self.inner.close()
+
+    class AsyncRetryTransport(httpx.AsyncBaseTransport):
+        def __init__(self, inner, retries: int):
+            self.inner = inner
+            self.retries = retries
+
+        async def handle_async_request(self, request):
+            _add_trace(request, is_async=True)
+            attempt = 0
+            while True:
+                last = attempt >= self.retries or not _retryable_request(
+                    request)
+                try:
+                    resp = await self.inner.handle_async_request(request)
+                except (httpx.ConnectError, httpx.ConnectTimeout,
+                        httpx.ReadTimeout, httpx.RemoteProtocolError):
+                    if last:
+                        raise
+                else:
+                    if last or resp.status_code not in RETRY_STATUSES:
+                        return resp
+                    await resp.aclose()
+                await asyncio.sleep(backoff(attempt))
+                attempt += 1
+
+        async def aclose(self):
+            await self.inner.aclose()
+
+    return RetryTransport, AsyncRetryTransport
+
+
+def _client_kwargs() -> dict:
+    import httpx
+
+    return {
+        "timeout": httpx.Timeout(_settings["read_timeout"],
+                                 connect=_settings["connect_timeout"]),
+        "follow_redirects": True,
+        "headers": DEFAULT_HEADERS,
+    }
+
+
+def _pool_kwargs() -> dict:
+    import httpx
+
+    return {
+        "http2": http2_available(),
+        "limits": httpx.Limits(max_connections=MAX_CONNECTIONS,
+                               max_keepalive_connections=MAX_KEEPALIVE,
+                               keepalive_expiry=KEEPALIVE_EXPIRY),
+    }
+
+
+def sync_client():
+    """Process-wide sync client (thread-safe, pooled, retrying)."""
+    global _sync_client
+    with _client_lock:
+        if _sync_client is None:
+            import httpx
+
+            caching, _ = _backends()
+            retrying, _ = _transports()
+            inner = httpx.HTTPTransport(**_pool_kwargs())
+            _install_dns_cache(inner, caching)
+            _sync_client = httpx.Client(
+                transport=retrying(inner, _settings["retries"]),
+                **_client_kwargs())
+        return _sync_client
+
+
+def async_client():
+    """A new async client with the same pooling, DNS cache and retries.
+
+    Async clients are bound to the event loop they are used on, so each
+    `asyncio.run` gets its own; share it across everything in that run.
+    """
+    import httpx
+
+    _, caching = _backends()
+    _, retrying = _transports()
+    inner = httpx.AsyncHTTPTransport(**_pool_kwargs())
+    _install_dns_cache(inner, caching)
+    return httpx.AsyncClient(
+        transport=retrying(inner, _settings["retries"]), **_client_kwargs())
@@ -14,18 +14,41 @@ Usage:
     uv run gemini_imagen.py -p "description" --dir charts --typst
     uv run gemini_imagen.py -p "edit this" -o out.png -i input.png
     uv run gemini_imagen.py -p "combine" -o out.png -i a.png -i b.png
+    uv run gemini_imagen.py --batch deck.jsonl --typst
+    uv run gemini_imagen.py -p "description" -o out.png --draft -n 6
+    uv run gemini_imagen.py -p "description" -o out.png --upscale 4 -r 4K
 """
 
 import argparse
-import base64
+import asyncio
+import json
 import os
-import re
+import random
 import sys
+import time
 from datetime import datetime
 from io import BytesIO
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "shared"))
+
+from image_io import (DEFAULT_DPI, DEFAULT_VARIANTS, EFFORTS, FORMATS,
+                      contact_sheet, file_digest, inline_bytes,
+                      make_renditions, parse_widths, pick_rendition,
+                      resolve_output, slugify)
+from image_io import save as save_image
+from input_store import InputStore
+from job_state import JobState, job_key
+import tracing
+from result_cache import ResultCache, request_key
+
 MODELS_WITH_IMAGE_CONFIG = {"gemini-3-pro-image-preview"}
+DRAFT_MODEL = "gemini-2.5-flash-image"
+UPSCALE_PROMPT = ("Re-render this draft as a finished, high-resolution image. "
+                  "Keep its composition, subjects and colours. The original "
+                  "request was: {prompt}")
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
 
 
 def get_api_key(provided_key: str | None) -> str | None:
@@ -34,14 +57,6 @@ def get_api_key(provided_key: str | None) -> str | None:
     return os.environ.get("GEMINI_API_KEY") or os.environ.get("GENAI_API_KEY")
 
 
-def slugify(text: str, max_len: int = 40) -> str:
-    """Convert prompt text to a filename-safe slug."""
-    text = text.lower()
-    text = re.sub(r"[^a-z0-9\s-]", "", text)
-    text = re.sub(r"[\s_]+", "-", text).strip("-")
-    return text[:max_len].rstrip("-")
-
-
 def auto_filename(prompt: str, output_dir: str) -> str:
     """Generate timestamped filename from prompt."""
     date = datetime.now().strftime("%Y-%m-%d")
@@ -49,7 +64,208 @@ def auto_filename(prompt: str, output_dir: str) -> str:
     return str(Path(output_dir) / f"{date}-{slug}.png")
 
 
-def generate_image(
+def retry_delay(err, attempt: int) -> float:
+    """Server-suggested delay (RetryInfo), else exponential backoff + jitter."""
+    try:
+        for detail in err.details["error"]["details"]:
+            if "retryDelay" in detail:
+                return float(detail["retryDelay"].rstrip("s"))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        pass
+    return min(60.0, 2.0 ** attempt) * (0.5 + random.random())
+
+
+async def call_with_backoff(fn, label: str):
+    """Await `fn()`, retrying rate-limit (429) and transient server errors."""
+    import httpx
+    from google.genai import errors
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await fn()
+        except errors.APIError as e:
+            if e.code not in RETRYABLE_CODES or attempt == MAX_RETRIES:
+                raise
+            reason = f"API returned {e.code}"
+            delay = retry_delay(e, attempt)
+        except httpx.TransportError as e:
+            if attempt == MAX_RETRIES:
+                raise
+            reason = f"network error ({e})"
+            delay = retry_delay(e, attempt)
+        print(f"{label}: {reason}, retrying in {delay:.1f}s...",
+              file=sys.stderr)
+        await asyncio.sleep(delay)
+
+
+def output_path_for(out: Path, index: int, part: int, num_images: int) -> str:
+    """Deterministic save path for image part `part` of request `index`."""
+    if num_images == 1 and part == 0:
+        return str(out)
+    return str(out.parent / f"{out.stem}_{index + 1}_{part + 1}{out.suffix or '.png'}")
+
+
+def extract_parts(response) -> tuple[list[str], list[tuple[str, bytes]]]:
+    """Model text and (mime type, bytes) image parts from a response."""
+    if not response.candidates:
+        raise ValueError("No candidates returned from the API.")
+    candidate = response.candidates[0]
+    if not candidate.content or not candidate.content.parts:
+        raise ValueError("No content parts in response.")
+
+    texts: list[str] = []
+    images: list[tuple[str, bytes]] = []
+    for part in candidate.content.parts:
+        if part.text is not None:
+            texts.append(part.text)
+        elif part.inline_data is not None:
+            images.append((part.inline_data.mime_type or "image/png",
+                           inline_bytes(part.inline_data.data)))
+    return texts, images
+
+
+def print_model_text(text: str) -> None:
+    try:
+        print(f"Model: {text}", file=sys.stderr, flush=True)
+    except UnicodeEncodeError:
+        print(f"Model: {text.encode('ascii', errors='replace').decode('ascii')}", file=sys.stderr, flush=True)
+
+
+def save_parts(texts: list[str], images: list[tuple[str, bytes]], out: Path,
+               index: int, num_images: int, effort: str = "default",
+               max_dim: int | None = None) -> list[str]:
+    """Print model text and save every image part; returns saved paths.
+
+    The output format follows the path suffix. Parts already in that format
+    (typically RGB PNG) are written as returned, without a re-encode.
+    """
+    for text in texts:
+        print_model_text(text)
+
+    saved_paths: list[str] = []
+    for _, data in images:
+        save_path = output_path_for(out, index, len(saved_paths), num_images)
+        save_image(data, save_path, effort=effort, max_dim=max_dim)
+        saved_paths.append(save_path)
+    return saved_paths
+
+
+async def stream_parts(client, model: str, contents, config, out: Path,
+                       index: int, num_images: int, writer=None,
+                       effort: str = "default",
+                       max_dim: int | None = None) -> list[str]:
+    """Stream one request, saving each image part as soon as it arrives.
+
+    Model text is printed as it comes in. Each image is decoded, saved,
+    added to the cache `writer` and dropped before the next chunk is read,
+    so at most one image is held in memory at a time.
+    """
+    texts: list[str] = []
+    try:
+        saved_paths = await _consume_stream(
+            client, model, contents, config, out, index, num_images, writer,
+            effort, max_dim, texts)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if not texts and not saved_paths:
+        raise ValueError("No content parts in response.")
+    if saved_paths and writer is not None:
+        await asyncio.to_thread(writer.commit, texts)
+    return saved_paths
+
+
+async def _consume_stream(client, model: str, contents, config, out: Path,
+                          index: int, num_images: int, writer, effort: str,
+                          max_dim: int | None, texts: list[str]) -> list[str]:
+    saved_paths: list[str] = []
+    stream = await client.aio.models.generate_content_stream(
+        model=model, contents=contents, config=config)
+    async for chunk in stream:
+        candidate = chunk.candidates[0] if chunk.candidates else None
+        if not candidate or not candidate.content or not candidate.content.parts:
+            continue
+        for part in candidate.content.parts:
+            if part.text is not None:
+                print_model_text(part.text)
+                texts.append(part.text)
+            elif part.inline_data is not None:
+                mime = part.inline_data.mime_type or "image/png"
+                data = inline_bytes(part.inline_data.data)
+                save_path = output_path_for(out, index, len(saved_paths),
+                                            num_images)
+                with tracing.span("save", image=index + 1, bytes=len(data)):
+                    await asyncio.to_thread(save_image, data, save_path,
+                                            effort=effort, max_dim=max_dim)
+                    if writer is not None:
+                        await asyncio.to_thread(writer.add_image, mime, data)
+                saved_paths.append(save_path)
+                print(f"Image {index + 1}/{num_images}: received "
+                      f"{save_path}", file=sys.stderr, flush=True)
+                del data
+        del chunk
+    return saved_paths
+
+
+def effective_resolution(input_images: list[str] | None, resolution: str) -> str:
+    """Bump the default 1K resolution to match large input images."""
+    from PIL import Image as PILImage
+
+    if not input_images or resolution != "1K":
+        return resolution
+    max_dim = 0
+    for img_path in input_images:
+        with PILImage.open(img_path) as img:  # header only, no decode
+            max_dim = max(max_dim, *img.size)
+    if max_dim >= 3000:
+        return "4K"
+    if max_dim >= 1500:
+        return "2K"
+    return resolution
+
+
+async def upload_input(client, types, store: InputStore, mime: str,
+                       data: bytes) -> dict:
+    """Upload one prepared input to the Files API and cache the handle."""
+    uploaded = await client.aio.files.upload(
+        file=BytesIO(data), config=types.UploadFileConfig(mime_type=mime))
+    expires = (uploaded.expiration_time.timestamp()
+               if uploaded.expiration_time else time.time() + 47 * 3600)
+    store.put_upload(data, uploaded.uri, uploaded.mime_type or mime, expires)
+    return {"uri": uploaded.uri, "mime": uploaded.mime_type or mime}
+
+
+async def input_parts(client, types, store: InputStore,
+                      payloads: list[tuple[str, bytes]], upload: str,
+                      num_requests: int) -> list:
+    """Gemini parts for prepared inputs, inline or as Files API references.
+
+    `upload="auto"` reuses a still-valid upload handle when there is one and
+    uploads fresh when several requests will share the inputs, falling back
+    to inline bytes if the upload fails.
+    """
+    parts = []
+    for mime, data in payloads:
+        handle = store.get_upload(data) if upload != "inline" else None
+        if handle is None and (upload == "files"
+                               or (upload == "auto" and num_requests > 1)):
+            try:
+                handle = await upload_input(client, types, store, mime, data)
+            except Exception as e:
+                if upload == "files":
+                    raise
+                print(f"Upload failed ({e}), sending input inline...",
+                      file=sys.stderr)
+        if handle:
+            parts.append(types.Part.from_uri(file_uri=handle["uri"],
+                                             mime_type=handle["mime"]))
+        else:
+            parts.append(types.Part.from_bytes(data=data, mime_type=mime))
+    return parts
+
+
+async def generate_image_async(
     prompt: str,
     output_path: str,
     model: str = "gemini-3-pro-image-preview",
@@ -58,109 +274,432 @@ def generate_image(
     num_images: int = 1,
     aspect_ratio: str | None = None,
     api_key: str | None = None,
+    concurrency: int = 4,
+    cache: ResultCache | None = None,
+    variant: int = 0,
+    seed: int | None = None,
+    upload: str = "auto",
+    effort: str = "default",
+    max_dim: int | None = None,
+    stream: bool = False,
 ) -> list[str]:
-    """Generate image(s) and return list of saved paths."""
-    key = get_api_key(api_key)
-    if not key:
-        print("Error: GEMINI_API_KEY not set.", file=sys.stderr)
-        print("  1. Get a key at https://ai.google.dev/", file=sys.stderr)
-        print("  2. fish: set -Ux GEMINI_API_KEY 'your-key'", file=sys.stderr)
-        print("  3. bash/zsh: export GEMINI_API_KEY='your-key'", file=sys.stderr)
-        sys.exit(1)
+    """Generate image(s) and return list of saved paths.
 
-    from google import genai
-    from google.genai import types
-    from PIL import Image as PILImage
+    Up to `concurrency` requests run at once. A failed image doesn't discard
+    the ones that succeeded; only if every request fails is the first error
+    raised.
 
-    client = genai.Client(api_key=key)
+    Image `i` is cached under variant `variant + i`, so re-running the same
+    request is free and a higher `variant` forces fresh samples. When every
+    image is cached, neither an API key nor `google.genai` is needed.
+
+    Input images are downscaled once to what `resolution` can use and, with
+    `upload` set to "files" (or "auto" for multi-image runs), sent once via
+    the Files API and referenced by every request.
+
+    With `stream`, responses are streamed: model text is printed as it
+    arrives and each image is saved (and cached) the moment its part is
+    complete instead of after the whole response.
+    """
+    if input_images and len(input_images) > 14:
+        raise ValueError(f"Max 14 input images, got {len(input_images)}.")
+
+    cache = cache or ResultCache()
     out = Path(output_path)
     out.parent.mkdir(parents=True, exist_ok=True)
+    resolution = effective_resolution(input_images, resolution)
+    input_digests = [file_digest(p) for p in input_images or []]
+    keys = [request_key(prompt, model, resolution, aspect_ratio,
+                        input_digests, variant + i, seed)
+            for i in range(num_images)]
+
+    results: list = [None] * num_images
+    misses = []
+    for i, key in enumerate(keys):
+        hit = cache.get(key)
+        if hit is None:
+            misses.append(i)
+        else:
+            print(f"Image {i + 1}/{num_images}: cached result", file=sys.stderr)
+            results[i] = save_parts(hit["texts"], hit["images"], out, i,
+                                    num_images, effort, max_dim)
+
+    if misses:
+        key = get_api_key(api_key)
+        if not key:
+            print("Error: GEMINI_API_KEY not set.", file=sys.stderr)
+            print("  1. Get a key at https://ai.google.dev/", file=sys.stderr)
+            print("  2. fish: set -Ux GEMINI_API_KEY 'your-key'", file=sys.stderr)
+            print("  3. bash/zsh: export GEMINI_API_KEY='your-key'", file=sys.stderr)
+            sys.exit(1)
+
+        with tracing.span("import", module="google.genai"):
+            from google import genai
+            from google.genai import types
+
+        # NANO_BANANA_API_URL points at a stand-in server (benchmarks)
+        base_url = os.environ.get("NANO_BANANA_API_URL")
+        http_options = ({"http_options": types.HttpOptions(base_url=base_url)}
+                        if base_url else {})
+        client = genai.Client(api_key=key, **http_options)
+
+        store = InputStore()
+        with tracing.span("inputs", count=len(input_images or []),
+                          upload=upload):
+            payloads = [store.payload(p, d, resolution)
+                        for p, d in zip(input_images or [], input_digests)]
+            parts: list = await input_parts(client, types, store, payloads,
+                                            upload, len(misses))
+        parts.append(prompt)
+        contents = parts if len(parts) > 1 else prompt
+
+        seed_kwargs = {"seed": seed} if seed is not None else {}
+        if model in MODELS_WITH_IMAGE_CONFIG:
+            img_cfg_kwargs = {"image_size": resolution}
+            if aspect_ratio:
+                img_cfg_kwargs["aspect_ratio"] = aspect_ratio
+            config = types.GenerateContentConfig(
+                response_modalities=["TEXT", "IMAGE"],
+                image_config=types.ImageConfig(**img_cfg_kwargs),
+                **seed_kwargs,
+            )
+        else:
+            img_cfg = types.ImageConfig(aspect_ratio=aspect_ratio) if aspect_ratio else None
+            config = types.GenerateContentConfig(
+                response_modalities=["TEXT", "IMAGE"],
+                image_config=img_cfg,
+                **seed_kwargs,
+            )
 
-    parts: list = []
-
-    if input_images:
-        if len(input_images) > 14:
-            raise ValueError(f"Max 14 input images, got {len(input_images)}.")
-        max_dim = 0
-        for img_path in input_images:
-            img = PILImage.open(img_path)
-            parts.append(img)
-            w, h = img.size
-            max_dim = max(max_dim, w, h)
-        if resolution == "1K" and max_dim > 0:
-            if max_dim >= 3000:
-                resolution = "4K"
-            elif max_dim >= 1500:
-                resolution = "2K"
-
-    parts.append(prompt)
-    contents = parts if len(parts) > 1 else prompt
-
-    if model in MODELS_WITH_IMAGE_CONFIG:
-        img_cfg_kwargs = {"image_size": resolution}
-        if aspect_ratio:
-            img_cfg_kwargs["aspect_ratio"] = aspect_ratio
-        config = types.GenerateContentConfig(
-            response_modalities=["TEXT", "IMAGE"],
-            image_config=types.ImageConfig(**img_cfg_kwargs),
-        )
-    else:
-        img_cfg = types.ImageConfig(aspect_ratio=aspect_ratio) if aspect_ratio else None
-        config = types.GenerateContentConfig(
-            response_modalities=["TEXT", "IMAGE"],
-            image_config=img_cfg,
-        )
+        mode = "Editing" if input_images else "Generating"
+        sem = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(i: int) -> list[str]:
+            async with sem:
+                print(f"{mode} image {i + 1}/{num_images}...", file=sys.stderr)
+                if stream:
+                    def attempt():
+                        # A retry starts a fresh entry; its files are rewritten
+                        writer = cache.writer(keys[i])
+                        return stream_parts(client, model, contents, config,
+                                            out, i, num_images, writer,
+                                            effort, max_dim)
+
+                    with tracing.span("gemini", image=i + 1, model=model,
+                                      stream=True):
+                        return await call_with_backoff(
+                            attempt, f"Image {i + 1}/{num_images}")
+                with tracing.span("gemini", image=i + 1, model=model) as sp:
+                    response = await call_with_backoff(
+                        lambda: client.aio.models.generate_content(
+                            model=model, contents=contents, config=config),
+                        f"Image {i + 1}/{num_images}")
+                    texts, images = extract_parts(response)
+                    sp["bytes"] = sum(len(data) for _, data in images)
+            if images:
+                await asyncio.to_thread(cache.put, keys[i], texts, images)
+            return await asyncio.to_thread(save_parts, texts, images, out, i,
+                                           num_images, effort, max_dim)
+
+        fresh = await asyncio.gather(*(one(i) for i in misses),
+                                     return_exceptions=True)
+        for i, result in zip(misses, fresh):
+            results[i] = result
 
     saved_paths: list[str] = []
-    base_name = out.stem
-    extension = out.suffix or ".png"
+    errors = []
+    for i, result in enumerate(results):
+        if isinstance(result, BaseException):
+            print(f"Image {i + 1}/{num_images} failed: {result}", file=sys.stderr)
+            errors.append(result)
+        else:
+            saved_paths.extend(result)
+    if errors and not saved_paths:
+        raise errors[0]
+    return saved_paths
 
-    for i in range(num_images):
-        mode = "Editing" if input_images else "Generating"
-        print(f"{mode} image {i + 1}/{num_images}...", file=sys.stderr)
 
-        response = client.models.generate_content(
-            model=model, contents=contents, config=config,
-        )
+@tracing.profiled
+def generate_image(prompt: str, output_path: str, **kwargs) -> list[str]:
+    """Generate image(s) and return list of saved paths.
 
-        if not response.candidates:
-            raise ValueError("No candidates returned from the API.")
-        candidate = response.candidates[0]
-        if not candidate.content or not candidate.content.parts:
-            raise ValueError("No content parts in response.")
+    Sync wrapper around `generate_image_async`; takes the same keyword
+    arguments.
+    """
+    return asyncio.run(generate_image_async(prompt, output_path, **kwargs))
 
-        img_count = 0
-        for part in candidate.content.parts:
-            if part.text is not None:
-                try:
-                    print(f"Model: {part.text}", file=sys.stderr)
-                except UnicodeEncodeError:
-                    print(f"Model: {part.text.encode('ascii', errors='replace').decode('ascii')}", file=sys.stderr)
-            elif part.inline_data is not None:
-                data = part.inline_data.data
-                if isinstance(data, str):
-                    data = base64.b64decode(data)
 
-                image = PILImage.open(BytesIO(data))
+def draft_base(out: Path) -> Path:
+    """Path the drafts for output `out` are numbered from."""
+    return out.with_name(f"{out.stem}-draft{out.suffix or '.png'}")
 
-                if num_images == 1 and img_count == 0:
-                    save_path = str(out)
-                else:
-                    save_path = str(out.parent / f"{base_name}_{i + 1}_{img_count + 1}{extension}")
 
-                if image.mode == "RGBA":
-                    rgb = PILImage.new("RGB", image.size, (255, 255, 255))
-                    rgb.paste(image, mask=image.split()[3])
-                    rgb.save(save_path, "PNG")
-                else:
-                    image.convert("RGB").save(save_path, "PNG")
+def draft_path(out: Path, number: int) -> str | None:
+    """Existing draft `number` (1-based) of output `out`, if any."""
+    base = draft_base(out)
+    candidates = [output_path_for(base, number - 1, 0, 2)]
+    if number == 1:
+        candidates.append(str(base))  # a single draft isn't numbered
+    return next((p for p in candidates if Path(p).exists()), None)
 
-                saved_paths.append(save_path)
-                img_count += 1
 
+def parse_indexes(spec: str) -> list[int]:
+    """`"2"` or `"1,3"` -> sorted unique 1-based draft numbers."""
+    numbers = sorted({int(n) for n in spec.split(",") if n.strip()})
+    if not numbers or numbers[0] < 1:
+        raise ValueError(spec)
+    return numbers
+
+
+@tracing.profiled
+async def draft_images_async(prompt: str, output_path: str,
+                             num_images: int = 4, model: str = DRAFT_MODEL,
+                             **kwargs) -> tuple[list[str], str | None]:
+    """Quick drafts on `model` plus a numbered contact sheet of them.
+
+    Drafts are saved next to `output_path` as `<name>-draft_<n>_1.png`
+    (the number `--upscale` takes); returns (draft paths, sheet path).
+    """
+    out = Path(output_path)
+    base = draft_base(out)
+    saved = await generate_image_async(prompt, str(base), model=model,
+                                       num_images=num_images, resolution="1K",
+                                       **kwargs)
+    numbered = {output_path_for(base, i, 0, num_images): i + 1
+                for i in range(num_images)}
+    items = [(str(numbered[p]), p) for p in saved if p in numbered]
+    if not items:
+        return saved, None
+    sheet = str(out.with_name(f"{out.stem}-drafts.jpg"))
+    with tracing.span("contact_sheet", images=len(items)):
+        await asyncio.to_thread(contact_sheet, items, sheet)
+    return saved, sheet
+
+
+@tracing.profiled
+async def upscale_drafts_async(prompt: str, output_path: str,
+                               numbers: list[int],
+                               model: str = "gemini-3-pro-image-preview",
+                               resolution: str = "2K",
+                               input_images: list[str] | None = None,
+                               **kwargs) -> list[str]:
+    """Re-render the chosen drafts on `model` at `resolution` (2K at least).
+
+    Each draft is sent as the first input image (followed by any original
+    inputs), so the final image keeps the composition that was picked. One
+    chosen draft is saved to `output_path`, several to `<name>_<n>_1.png`.
+    """
+    out = Path(output_path)
+    drafts = {}
+    for n in numbers:
+        drafts[n] = draft_path(out, n)
+        if drafts[n] is None:
+            raise FileNotFoundError(
+                f"draft {n} not found next to {out}; run with --draft first")
+    if resolution == "1K":
+        resolution = "2K"
+    targets = {n: str(out) if len(numbers) == 1
+               else output_path_for(out, n - 1, 0, 2) for n in numbers}
+    results = await asyncio.gather(
+        *(generate_image_async(
+            UPSCALE_PROMPT.format(prompt=prompt), targets[n], model=model,
+            input_images=[drafts[n]] + list(input_images or []),
+            resolution=resolution, num_images=1, **kwargs)
+          for n in numbers),
+        return_exceptions=True)
+    saved_paths: list[str] = []
+    errors = []
+    for n, result in zip(numbers, results):
+        if isinstance(result, BaseException):
+            print(f"Draft {n} failed: {result}", file=sys.stderr)
+            errors.append(result)
+        else:
+            saved_paths.extend(result)
+    if errors and not saved_paths:
+        raise errors[0]
     return saved_paths
 
 
+def load_jobs(path: str) -> list[dict]:
+    """Read a JSONL job manifest, skipping blank lines and `#` comments."""
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{lineno}: {e}") from None
+            if not isinstance(job, dict) or not job.get("prompt"):
+                raise ValueError(f"{path}:{lineno}: each entry needs a 'prompt'")
+            if isinstance(job.get("inputs"), str):
+                job["inputs"] = [job["inputs"]]
+            jobs.append(job)
+    return jobs
+
+
+async def run_live(job: dict, **kwargs) -> list[str]:
+    """Generate one manifest job right away; returns its saved paths."""
+    return await generate_image_async(
+        job["prompt"], job["output"], model=job["model"],
+        input_images=job["inputs"] or None, resolution=job["resolution"],
+        num_images=job["num"], aspect_ratio=job["aspect"],
+        variant=job["variant"], seed=job["seed"], **kwargs)
+
+
+def missing_images(job: dict, paths: list[str]) -> list[int]:
+    """1-based numbers of the job's requests that saved no image."""
+    out, num = Path(job["output"]), int(job["num"])
+    saved = set(paths)
+    return [i + 1 for i in range(num)
+            if output_path_for(out, i, 0, num) not in saved]
+
+
+# How jobs are run, by name. A deferred backend (e.g. the Batch API) would
+# mark jobs "submitted" with a `remote` handle in the state file and collect
+# their images on a later run instead of returning them at once.
+BACKENDS = {"live": run_live}
+
+
+async def run_jobs(jobs: list[dict], state: JobState, parallel: int = 4,
+                   backend: str = "live", refresh: bool = False,
+                   **kwargs) -> list[dict]:
+    """Run manifest jobs `parallel` at a time, checkpointing each to `state`.
+
+    Jobs already done in `state` (with their files present) are skipped
+    unless `refresh`. Returns one result dict per job, in manifest order.
+    """
+    sem = asyncio.Semaphore(max(1, parallel))
+    runner = BACKENDS[backend]
+
+    async def one(idx: int, job: dict) -> dict:
+        key = job["key"]
+        result = {"index": idx, "prompt": job["prompt"], "ok": False,
+                  "paths": [], "error": None, "skipped": False}
+        if not refresh and state.is_done(key):
+            result.update(ok=True, paths=state.get(key)["paths"],
+                          skipped=True)
+            return result
+        async with sem:
+            state.update(key, index=idx, prompt=job["prompt"],
+                         output=job["output"], status="running", error=None)
+            print(f"[{idx + 1}/{len(jobs)}] {job['prompt'][:60]}",
+                  file=sys.stderr)
+            try:
+                result["paths"] = await runner(job, **kwargs)
+                if not result["paths"]:
+                    raise RuntimeError("no image in response")
+                missing = missing_images(job, result["paths"])
+                if missing:
+                    # Retried next run; the finished images come from the
+                    # result cache
+                    result["error"] = (f"image(s) {', '.join(map(str, missing))}"
+                                       f" of {job['num']} failed")
+                    state.update(key, status="partial", paths=result["paths"],
+                                 error=result["error"])
+                    print(f"[{idx + 1}/{len(jobs)}] {result['error']}",
+                          file=sys.stderr)
+                else:
+                    result["ok"] = True
+                    state.update(key, status="done", paths=result["paths"])
+            except Exception as e:
+                result["error"] = str(e) or type(e).__name__
+                state.update(key, status="failed", error=result["error"])
+                print(f"[{idx + 1}/{len(jobs)}] failed: {result['error']}",
+                      file=sys.stderr)
+        return result
+
+    return list(await asyncio.gather(
+        *(one(i, job) for i, job in enumerate(jobs))))
+
+
+def main_batch(args, widths: list[int] | None) -> None:
+    """`--batch jobs.jsonl`: run every job, resuming from the state file."""
+    defaults = {"model": args.model, "resolution": args.resolution,
+                "aspect": args.aspect_ratio, "inputs": args.input_images or [],
+                "num": args.num_images, "seed": args.seed,
+                "variant": args.variant, "dir": args.dir,
+                "format": args.format}
+    try:
+        jobs = [{**defaults, **{k: v for k, v in job.items() if v is not None}}
+                for job in load_jobs(args.batch)]
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    state = JobState(Path(args.state or Path(args.batch).with_suffix(
+        ".state.json")))
+    keys: set[str] = set()
+    taken: set[str] = set()
+    for idx, job in enumerate(jobs):
+        job["key"] = job_key(job)
+        if job["key"] in keys:
+            print(f"Error: job {idx + 1} repeats an earlier job",
+                  file=sys.stderr)
+            sys.exit(1)
+        keys.add(job["key"])
+        previous = state.get(job["key"])
+        # Auto-named outputs are date-stamped; keep the one chosen first
+        output = (job.get("output")
+                  or (previous or {}).get("output")
+                  or auto_filename(job["prompt"], job["dir"]))
+        output = resolve_output(output, job["format"])
+        stem, n = Path(output), 2
+        while output in taken:
+            output = str(stem.with_name(f"{stem.stem}-{n}{stem.suffix}"))
+            n += 1
+        taken.add(output)
+        job["output"] = output
+
+    cache = ResultCache(read=not (args.no_cache or args.refresh),
+                        write=not args.no_cache)
+    results = asyncio.run(run_jobs(
+        jobs, state, args.jobs, refresh=args.refresh, api_key=args.api_key,
+        concurrency=args.concurrency, cache=cache, upload=args.upload,
+        effort=args.effort, max_dim=args.max_dim, stream=args.stream))
+
+    results_path = args.results or str(
+        Path(args.batch).with_suffix(".results.jsonl"))
+    with open(results_path, "w", encoding="utf-8") as f:
+        for r in results:
+            f.write(json.dumps(r) + "\n")
+
+    variants = {}
+    if widths:
+        variants = make_renditions([p for r in results for p in r["paths"]],
+                                   widths, args.variants_format, args.effort,
+                                   args.jobs)
+    for r in results:
+        for p in r["paths"]:  # a partial job keeps the images it got
+            print(f"Saved: {p} ({format_size(p)})")
+            for _, rendition in variants.get(p, []):
+                print(f"Saved: {rendition} ({format_size(rendition)})")
+        if not r["ok"]:
+            print(f"Failed: {r['prompt'][:60]} ({r['error']})")
+
+    if args.typst:
+        print("\nTypst:")
+        for job, r in zip(jobs, results):
+            width = job.get("width") or args.width
+            caption = (job.get("caption") or slugify(job["prompt"], 60)
+                       .replace("-", " ").title())
+            for p in r["paths"]:
+                shown = pick_rendition(p, variants.get(p, []), width, args.dpi)
+                print(f"""#figure(
+  image("{shown}", width: {width}),
+  caption: [{caption}],
+)""")
+
+    failed = sum(not r["ok"] for r in results)
+    skipped = sum(r["skipped"] for r in results)
+    print(f"\nResults: {results_path} ({len(results) - failed}/{len(results)} "
+          f"ok, {skipped} already done)")
+    if failed:
+        sys.exit(1)
+
+
 def format_size(path: str) -> str:
     size = Path(path).stat().st_size
     if size >= 1024 * 1024:
@@ -172,7 +711,7 @@ def main():
     parser = argparse.ArgumentParser(
         description="Generate images via Gemini Image API.",
     )
-    parser.add_argument("--prompt", "-p", required=True)
+    parser.add_argument("--prompt", "-p", default=None)
     parser.add_argument("--output", "-o", default=None,
                         help="Output path. If omitted, auto-generated from prompt + --dir.")
     parser.add_argument("--dir", "-d", default="images",
@@ -184,7 +723,74 @@ def main():
                         choices=["1:1", "2:3", "3:2", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9"],
                         help="Output image aspect ratio")
     parser.add_argument("--num-images", "-n", type=int, default=1)
+    parser.add_argument("--concurrency", "-j", type=int, default=4,
+                        help="Parallel generation requests (default: 4)")
+    parser.add_argument("--draft", action="store_true",
+                        help="Generate -n quick drafts on --draft-model and "
+                             "a numbered contact sheet to pick from")
+    parser.add_argument("--draft-model", default=DRAFT_MODEL,
+                        help=f"Model for --draft (default: {DRAFT_MODEL})")
+    parser.add_argument("--upscale", metavar="N[,N...]", default=None,
+                        help="Re-render these --draft numbers on --model at "
+                             "--resolution (at least 2K)")
+    parser.add_argument("--batch", metavar="MANIFEST", default=None,
+                        help="Run every job in a JSONL manifest, resuming "
+                             "an interrupted run")
+    parser.add_argument("--jobs", type=int, default=4,
+                        help="Manifest jobs run at once, each with up to "
+                             "--concurrency requests (default: 4)")
+    parser.add_argument("--state", default=None,
+                        help="Batch progress file "
+                             "(default: <manifest>.state.json)")
+    parser.add_argument("--results", default=None,
+                        help="Batch results JSONL "
+                             "(default: <manifest>.results.jsonl)")
+    parser.add_argument("--upload", choices=["auto", "inline", "files"],
+                        default="auto",
+                        help="How input images are sent: inline bytes or a "
+                             "Files API upload shared by all requests "
+                             "(default: auto)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses: print model text as it "
+                             "arrives and save each image as soon as it is "
+                             "complete")
+    parser.add_argument("--format", "-f", choices=list(FORMATS), default=None,
+                        help="Output format (default: from --output suffix, "
+                             "else png)")
+    parser.add_argument("--effort", choices=EFFORTS, default="default",
+                        help="Compression effort when an image has to be "
+                             "re-encoded (default: default)")
+    parser.add_argument("--max-dim", type=int, default=None,
+                        help="Downscale saved images to this longest edge")
+    parser.add_argument("--variants", nargs="?", metavar="WIDTHS",
+                        const=",".join(map(str, DEFAULT_VARIANTS)),
+                        default=None,
+                        help="Also write downscaled renditions at these "
+                             "pixel widths (default: 480,960,1920); Typst "
+                             "code uses the smallest one sharp enough")
+    parser.add_argument("--variants-format", choices=list(FORMATS),
+                        default=None,
+                        help="Rendition format (default: same as the image)")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI,
+                        help="Resolution a rendition must reach at --width "
+                             "(default: 150)")
+    parser.add_argument("--variant", type=int, default=0,
+                        help="First sample index; change it to get fresh images "
+                             "instead of cached ones (default: 0)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Sampling seed (also part of the cache key)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore cached results and call the API again")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Neither read nor write the result cache")
     parser.add_argument("--api-key", "-k")
+    parser.add_argument("--trace", metavar="PATH", default=None,
+                        help="Write timing spans for every phase to PATH "
+                             "(.json: Chrome trace format, else JSON lines)")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"],
+                        default=None,
+                        help="Profile the download/generation with cProfile "
+                             "or tracemalloc (summary on stderr)")
     # Typst integration flags
     parser.add_argument("--typst", action="store_true",
                         help="Print Typst figure code after generation")
@@ -193,44 +799,106 @@ def main():
     parser.add_argument("--caption", default=None,
                         help="Typst figure caption (auto-generated if omitted)")
     args = parser.parse_args()
-
-    # Resolve output path
-    if args.output:
-        output_path = args.output
-    else:
-        output_path = auto_filename(args.prompt, args.dir)
-
-    try:
-        saved = generate_image(
-            prompt=args.prompt,
-            output_path=output_path,
-            model=args.model,
-            input_images=args.input_images,
-            resolution=args.resolution,
-            num_images=args.num_images,
-            aspect_ratio=args.aspect_ratio,
-            api_key=args.api_key,
-        )
-
-        # Print summary to stdout (this is what Claude reads)
-        for p in saved:
-            print(f"Saved: {p} ({format_size(p)})")
-
-        # Typst code output
-        if args.typst:
-            print("\nTypst:")
+    if not (args.prompt or args.batch):
+        parser.error("--prompt is required unless --batch is given")
+    if sum(map(bool, (args.batch, args.draft, args.upscale))) > 1:
+        parser.error("--batch, --draft and --upscale can't be combined")
+    numbers = None
+    if args.upscale:
+        try:
+            numbers = parse_indexes(args.upscale)
+        except ValueError:
+            parser.error(f"--upscale must look like 2 or 1,3, "
+                         f"got '{args.upscale}'")
+    widths = None
+    if args.variants:
+        try:
+            widths = parse_widths(args.variants)
+        except ValueError:
+            parser.error(f"--variants must look like 480,960, "
+                         f"got '{args.variants}'")
+
+    with tracing.session(args.trace, args.profile):
+        if args.batch:
+            main_batch(args, widths)
+            return
+
+        # Resolve output path
+        if args.output:
+            output_path = args.output
+        else:
+            output_path = auto_filename(args.prompt, args.dir)
+        output_path = resolve_output(output_path, args.format)
+
+        try:
+            options = dict(
+                input_images=args.input_images,
+                aspect_ratio=args.aspect_ratio,
+                api_key=args.api_key,
+                concurrency=args.concurrency,
+                cache=ResultCache(read=not (args.no_cache or args.refresh),
+                                  write=not args.no_cache),
+                variant=args.variant,
+                seed=args.seed,
+                upload=args.upload,
+                effort=args.effort,
+                max_dim=args.max_dim,
+                stream=args.stream,
+            )
+            if args.draft:
+                drafts, sheet = asyncio.run(draft_images_async(
+                    args.prompt, output_path, args.num_images,
+                    args.draft_model, **options))
+                for p in drafts:
+                    print(f"Saved: {p} ({format_size(p)})")
+                if sheet:
+                    print(f"Contact sheet: {sheet}")
+                print("\nPick drafts by number and re-run with --upscale N "
+                      "(same prompt and output) for the final image.")
+                return
+            if numbers:
+                saved = asyncio.run(upscale_drafts_async(
+                    args.prompt, output_path, numbers, args.model,
+                    args.resolution, **options))
+            else:
+                saved = generate_image(
+                    prompt=args.prompt,
+                    output_path=output_path,
+                    model=args.model,
+                    resolution=args.resolution,
+                    num_images=args.num_images,
+                    **options,
+                )
+
+            variants = {}
+            if widths:
+                variants = make_renditions(saved, widths, args.variants_format,
+                                           args.effort, args.concurrency)
+
+            # Print summary to stdout (this is what Claude reads)
             for p in saved:
-                caption = args.caption or slugify(args.prompt, 60).replace("-", " ").title()
-                print(f"""#figure(
-  image("{p}", width: {args.width}),
+                print(f"Saved: {p} ({format_size(p)})")
+                for _, r in variants.get(p, []):
+                    print(f"Saved: {r} ({format_size(r)})")
+
+            # Typst code output
+            if args.typst:
+                print("\nTypst:")
+                for p in saved:
+                    caption = (args.caption or slugify(args.prompt, 60)
+                               .replace("-", " ").title())
+                    shown = pick_rendition(p, variants.get(p, []), args.width,
+                                           args.dpi)
+                    print(f"""#figure(
+  image("{shown}", width: {args.width}),
   caption: [{caption}],
 )""")
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc(file=sys.stdout)
-        print(f"Error: {e}", file=sys.stderr)
-        sys.exit(1)
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=sys.stdout)
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
 
 
 if __name__ == "__main__":
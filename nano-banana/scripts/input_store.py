@@ -0,0 +1,130 @@
+"""
+Prepared input images for edit requests.
+
+Inputs are read header-first: an image that already fits the target
+resolution and is in a format Gemini accepts is sent as its original bytes,
+anything larger is downscaled once (JPEG via draft-mode DCT scaling, see
+`image_io.decode`) and re-encoded compactly. The re-encoded payloads are cached
+on disk by source content hash (trimmed least-recently-used first once they
+grow past their size cap), and so are Files API upload handles for them, so
+repeat edits and multi-sample runs reuse the same bytes or the same uploaded
+file instead of re-sending megabytes of identical input.
+"""
+
+import hashlib
+import json
+import os
+import time
+from io import BytesIO
+from pathlib import Path
+
+from image_io import decode, write_atomic
+from result_cache import cache_dir
+
+# Longest input edge worth sending for each output resolution
+INPUT_MAX_DIM = {"1K": 1024, "2K": 2048, "4K": 4096}
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png",
+                       "WEBP": "image/webp"}
+UPLOAD_MARGIN = 3600  # don't reuse a Files API handle this close to expiry
+MAX_INPUT_BYTES = 256 * 1024 * 1024
+PAYLOAD_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png",
+                      "image/webp": ".webp"}
+
+
+def passthrough_mime(img, max_dim: int) -> str | None:
+    """Mime type if the opened image can be sent as its original bytes."""
+    if max(img.size) <= max_dim and img.format in PASSTHROUGH_FORMATS:
+        return PASSTHROUGH_FORMATS[img.format]
+    return None
+
+
+def encode_input(path: str, max_dim: int) -> tuple[str, bytes]:
+    """(mime type, bytes) for one input image, downscaled to `max_dim`."""
+    from PIL import Image as PILImage
+
+    with PILImage.open(path) as img:  # header only so far
+        mime = passthrough_mime(img, max_dim)
+        if mime is not None:
+            return mime, Path(path).read_bytes()
+        img = decode(img, max_dim)
+        has_alpha = (img.mode in ("RGBA", "LA")
+                     or (img.mode == "P" and "transparency" in img.info))
+        buf = BytesIO()
+        if has_alpha:
+            img.convert("RGBA").save(buf, "PNG")
+            return "image/png", buf.getvalue()
+        img.convert("RGB").save(buf, "JPEG", quality=90)
+        return "image/jpeg", buf.getvalue()
+
+
+class InputStore:
+    """On-disk cache of prepared input payloads and their upload handles.
+
+    Only re-encoded payloads are stored; inputs that are sent as-is are
+    read from their source file every time.
+    """
+
+    def __init__(self, root: Path | None = None,
+                 max_bytes: int = MAX_INPUT_BYTES):
+        self.root = (root or cache_dir()) / "inputs"
+        self.max_bytes = max_bytes
+
+    def payload(self, path: str, digest: str,
+                resolution: str) -> tuple[str, bytes]:
+        """Prepared (mime, bytes) for `path`, whose content hash is `digest`."""
+        from PIL import Image as PILImage
+
+        max_dim = INPUT_MAX_DIM.get(resolution, INPUT_MAX_DIM["4K"])
+        stem = f"{digest}-{max_dim}"
+        for mime, ext in PAYLOAD_EXTENSIONS.items():
+            cached = self.root / f"{stem}{ext}"
+            try:
+                data = cached.read_bytes()
+            except OSError:
+                continue
+            os.utime(cached)  # LRU recency
+            return mime, data
+        with PILImage.open(path) as img:  # header only
+            mime = passthrough_mime(img, max_dim)
+        if mime is not None:
+            return mime, Path(path).read_bytes()
+        mime, data = encode_input(path, max_dim)
+        write_atomic(self.root / f"{stem}{PAYLOAD_EXTENSIONS[mime]}", data)
+        self.evict()
+        return mime, data
+
+    def evict(self) -> None:
+        """Delete least-recently-used payloads until under `max_bytes`."""
+        entries = []
+        total = 0
+        for ext in PAYLOAD_EXTENSIONS.values():
+            for f in self.root.glob(f"*{ext}"):
+                try:
+                    st = f.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, f))
+                total += st.st_size
+        for _, size, f in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+
+    def _upload_path(self, data: bytes) -> Path:
+        return self.root / "uploads" / f"{hashlib.sha256(data).hexdigest()}.json"
+
+    def get_upload(self, data: bytes) -> dict | None:
+        """Cached `{"uri", "mime"}` for an uploaded payload, if still valid."""
+        try:
+            handle = json.loads(self._upload_path(data).read_text())
+        except (OSError, ValueError):
+            return None
+        if handle.get("expires", 0) < time.time() + UPLOAD_MARGIN:
+            return None
+        return handle
+
+    def put_upload(self, data: bytes, uri: str, mime: str,
+                   expires: float) -> None:
+        write_atomic(self._upload_path(data), json.dumps(
+            {"uri": uri, "mime": mime, "expires": expires}).encode())
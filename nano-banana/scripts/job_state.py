@@ -0,0 +1,75 @@
+"""
+Checkpointed progress of a `--batch` generation run.
+
+Every job in a manifest is keyed by a hash of the fields that decide its
+images (prompt, model, resolution, aspect ratio, inputs, count, seed,
+variant, output), and its status, output path and saved files are written to
+a JSON state file next to the manifest after every change. An interrupted or
+partly failed run started again with the same manifest skips jobs that are
+done and whose files still exist; editing a manifest line turns it into a
+new job.
+
+Statuses: "pending", "running", "done", "failed", "partial" (some of a
+job's `num` images failed; retried like "failed"), plus "submitted" for
+backends that hand jobs off and collect the results later (the job's
+`remote` field then holds whatever the backend needs to find them again).
+A job left "running" or "submitted" by a crashed run is picked up again by
+the next one.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+STATE_VERSION = 1
+# Manifest fields that change the generated images
+JOB_FIELDS = ("prompt", "model", "resolution", "aspect", "inputs", "num",
+              "seed", "variant", "output", "dir", "format")
+
+
+def job_key(job: dict) -> str:
+    spec = {k: job.get(k) for k in JOB_FIELDS}
+    return hashlib.sha256(
+        json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class JobState:
+    """Per-job status of one manifest, saved atomically on every update."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.jobs: dict[str, dict] = {}
+        try:
+            state = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if state.get("version") == STATE_VERSION:
+            self.jobs = state.get("jobs", {})
+
+    def get(self, key: str) -> dict | None:
+        return self.jobs.get(key)
+
+    def is_done(self, key: str) -> bool:
+        job = self.jobs.get(key)
+        return (job is not None and job.get("status") == "done"
+                and bool(job.get("paths"))
+                and all(Path(p).exists() for p in job["paths"]))
+
+    def update(self, key: str, **fields) -> dict:
+        job = self.jobs.setdefault(key, {"attempts": 0})
+        if fields.get("status") == "running":
+            job["attempts"] = job.get("attempts", 0) + 1
+        job.update(fields, updated=time.time())
+        self.save()
+        return job
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}")
+        tmp.write_text(json.dumps({"version": STATE_VERSION,
+                                   "jobs": self.jobs}, indent=2) + "\n",
+                       encoding="utf-8")
+        os.replace(tmp, self.path)
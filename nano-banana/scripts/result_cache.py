@@ -0,0 +1,174 @@
+"""
+Local cache of Gemini generation results.
+
+Each entry holds the raw image parts and model text returned for one request,
+keyed by a canonical hash of everything that determines the output (prompt,
+model, resolution, aspect ratio, input image contents, seed and variant
+index). Entries live in their own directory and are published with an atomic
+rename, so parallel invocations never see half-written results. The cache is
+trimmed least-recently-used first once it grows past its size cap.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+MAX_CACHE_BYTES = 1024 * 1024 * 1024
+MIME_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg",
+                   "image/webp": ".webp"}
+
+
+def cache_dir() -> Path:
+    """Root cache directory (`$NANO_BANANA_CACHE` or XDG cache)."""
+    override = os.environ.get("NANO_BANANA_CACHE")
+    if override:
+        return Path(override)
+    xdg = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(xdg) / "claude-skills" / "nano-banana"
+
+
+def request_key(prompt: str, model: str, resolution: str,
+                aspect_ratio: str | None, input_digests: list[str],
+                variant: int, seed: int | None = None) -> str:
+    """Canonical hash of one generation request."""
+    blob = json.dumps({
+        "prompt": prompt, "model": model, "resolution": resolution,
+        "aspect_ratio": aspect_ratio, "inputs": input_digests,
+        "variant": variant, "seed": seed,
+    }, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ResultCache:
+    """Directory-per-entry result cache with a total size cap.
+
+    `read=False` skips lookups (refresh), `write=False` skips stores.
+    """
+
+    def __init__(self, root: Path | None = None, read: bool = True,
+                 write: bool = True, max_bytes: int = MAX_CACHE_BYTES):
+        self.root = root or cache_dir()
+        self.read = read
+        self.write = write
+        self.max_bytes = max_bytes
+
+    def _entry(self, key: str) -> Path:
+        return self.root / "results" / key[:2] / key
+
+    def get(self, key: str) -> dict | None:
+        """`{"texts": [...], "images": [(mime, bytes), ...]}` or None."""
+        if not self.read:
+            return None
+        entry = self._entry(key)
+        try:
+            meta = json.loads((entry / "meta.json").read_text())
+            images = [(img["mime"], (entry / img["file"]).read_bytes())
+                      for img in meta["images"]]
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(entry / "meta.json")  # LRU recency
+        return {"texts": meta["texts"], "images": images}
+
+    def put(self, key: str, texts: list[str],
+            images: list[tuple[str, bytes]]) -> None:
+        writer = self.writer(key)
+        for mime, data in images:
+            writer.add_image(mime, data)
+        writer.commit(texts)
+
+    def writer(self, key: str) -> "EntryWriter":
+        """Incremental `put`: add images one at a time, then commit."""
+        return EntryWriter(self, key)
+
+    def evict(self) -> None:
+        """Delete least-recently-used entries until under `max_bytes`."""
+        entries = []
+        total = 0
+        for meta in (self.root / "results").glob("*/*/meta.json"):
+            try:
+                size = sum(f.stat().st_size for f in meta.parent.iterdir())
+                entries.append((meta.stat().st_mtime, size, meta.parent))
+            except OSError:
+                continue
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+class EntryWriter:
+    """One cache entry built image by image in a private directory.
+
+    Nothing is visible to readers until `commit()` renames the directory
+    into place; an entry that is never committed is removed by `abort()`.
+    """
+
+    def __init__(self, cache: ResultCache, key: str):
+        self.cache = cache
+        self.entry = cache._entry(key)
+        self.tmp: Path | None = None
+        self.files: list[dict] = []
+        self.failed = not cache.write
+
+    def add_image(self, mime: str, data: bytes) -> None:
+        if self.failed:
+            return
+        try:
+            if self.tmp is None:
+                self.tmp = self.entry.with_name(
+                    f".{self.entry.name}.{uuid.uuid4().hex}")
+                self.tmp.mkdir(parents=True)
+            name = f"{len(self.files)}{MIME_EXTENSIONS.get(mime, '.bin')}"
+            (self.tmp / name).write_bytes(data)
+            self.files.append({"mime": mime, "file": name})
+        except OSError:
+            self.abort()
+
+    def commit(self, texts: list[str]) -> None:
+        if self.failed:
+            return
+        try:
+            if self.tmp is None:
+                self.tmp = self.entry.with_name(
+                    f".{self.entry.name}.{uuid.uuid4().hex}")
+                self.tmp.mkdir(parents=True)
+            (self.tmp / "meta.json").write_text(json.dumps(
+                {"texts": texts, "images": self.files,
+                 "created": time.time()}))
+            try:
+                os.replace(self.tmp, self.entry)
+            except OSError:
+                if self.cache.read and (self.entry / "meta.json").exists():
+                    # Another process stored the same result first
+                    shutil.rmtree(self.tmp, ignore_errors=True)
+                else:
+                    # A refresh (or a broken entry): the new result wins
+                    self._swap_in()
+        except OSError:
+            self.abort()
+            return
+        self.tmp = None
+        self.cache.evict()
+
+    def _swap_in(self) -> None:
+        """Replace the existing entry with ours, removing the old one."""
+        aside = self.entry.with_name(f".{self.entry.name}.{uuid.uuid4().hex}")
+        try:
+            os.rename(self.entry, aside)
+        except FileNotFoundError:
+            aside = None
+        os.replace(self.tmp, self.entry)
+        if aside is not None:
+            shutil.rmtree(aside, ignore_errors=True)
+
+    def abort(self) -> None:
+        self.failed = True
+        if self.tmp is not None:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+            self.tmp = None
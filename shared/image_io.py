@@ -0,0 +1,358 @@
+"""
+Image normalization shared by the image-producing skills.
+
+Every saved image ends up as an opaque file in one of a few formats that
+Typst embeds directly. Sources that already are that (e.g. an RGB PNG from
+Gemini saved as PNG) are written byte-for-byte without being decoded or
+re-encoded at all; everything else is decoded once, alpha is flattened onto
+white and the result is encoded at the requested compression effort. With a
+maximum dimension set, JPEG sources are decoded at reduced scale via draft
+mode and other formats are shrunk with `reduce()` before the final resize.
+
+Renditions (`--variants`) are a set of narrower copies of one saved image,
+all produced from a single decode, so a document can embed the smallest one
+that is still sharp at the width it is shown.
+
+A contact sheet is a numbered grid of thumbnails of several images in one
+file, for choosing between drafts at a glance.
+"""
+
+import binascii
+import hashlib
+import os
+import re
+import uuid
+from io import BytesIO
+from pathlib import Path
+
+import tracing
+
+# format name -> (PIL format, file suffix)
+FORMATS = {"png": ("PNG", ".png"), "jpeg": ("JPEG", ".jpg"),
+           "webp": ("WEBP", ".webp")}
+SUFFIX_FORMATS = {".png": "png", ".jpg": "jpeg", ".jpeg": "jpeg",
+                  ".webp": "webp"}
+EFFORTS = ("fast", "default", "max")
+OPAQUE_MODES = {"RGB", "L"}
+
+# encoder options per (format, effort)
+SAVE_OPTIONS = {
+    ("png", "fast"): {"compress_level": 1},
+    ("png", "default"): {"compress_level": 6},
+    ("png", "max"): {"compress_level": 9, "optimize": True},
+    ("jpeg", "fast"): {"quality": 90},
+    ("jpeg", "default"): {"quality": 90, "optimize": True},
+    ("jpeg", "max"): {"quality": 90, "optimize": True, "progressive": True},
+    ("webp", "fast"): {"quality": 90, "method": 0},
+    ("webp", "default"): {"quality": 90, "method": 4},
+    ("webp", "max"): {"quality": 90, "method": 6},
+}
+
+
+class ImageTooLarge(ValueError):
+    """The image's pixel count exceeds the caller's cap."""
+
+
+def slugify(text: str, max_len: int = 40) -> str:
+    """Convert text to a filename-safe slug."""
+    text = text.lower()
+    text = re.sub(r"[^a-z0-9\s-]", "", text)
+    text = re.sub(r"[\s_]+", "-", text).strip("-")
+    return text[:max_len].rstrip("-")
+
+
+def suffix_format(path: str) -> str:
+    """Output format implied by a path's suffix (PNG when unknown)."""
+    return SUFFIX_FORMATS.get(Path(path).suffix.lower(), "png")
+
+
+def resolve_output(path: str, fmt: str | None = None) -> str:
+    """`path` with the suffix of `fmt`; without `fmt` a known suffix stays."""
+    suffix = Path(path).suffix.lower()
+    if fmt is None:
+        if suffix in SUFFIX_FORMATS:
+            return path
+        fmt = "png"
+    if SUFFIX_FORMATS.get(suffix) == fmt:
+        return path
+    return str(Path(path).with_suffix(FORMATS[fmt][1]))
+
+
+def inline_bytes(data: bytes | str) -> bytes:
+    """Raw bytes of an API `inline_data` payload.
+
+    The SDK usually hands over bytes already. A base64 string is decoded
+    straight from the str, without the intermediate ASCII-encoded copy
+    `base64.b64decode` makes first.
+    """
+    if isinstance(data, str):
+        return binascii.a2b_base64(data)
+    return data
+
+
+def _open(source):
+    from PIL import Image as PILImage
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return PILImage.open(BytesIO(source))  # shares the buffer, no copy
+    return PILImage.open(source)
+
+
+def is_passthrough(img, fmt: str, max_dim: int | None = None) -> bool:
+    """Whether an opened (header-only) image can be saved as-is."""
+    return (img.format == FORMATS[fmt][0]
+            and img.mode in OPAQUE_MODES
+            and "transparency" not in img.info
+            and (max_dim is None or max(img.size) <= max_dim))
+
+
+def decode(img, max_dim: int | None = None):
+    """Decode an opened image, at reduced scale when `max_dim` is set."""
+    from PIL import Image as PILImage
+
+    if max_dim is None or max(img.size) <= max_dim:
+        img.load()
+        return img
+    img.draft("RGB", (max_dim, max_dim))  # no-op unless JPEG
+    factor = max(img.size) // max_dim
+    if factor > 1:
+        img = img.reduce(factor)
+    img.thumbnail((max_dim, max_dim), PILImage.Resampling.LANCZOS)
+    return img
+
+
+def flatten(img):
+    """RGB copy of `img` with any transparency composited onto white."""
+    from PIL import Image as PILImage
+
+    if img.mode == "P" and "transparency" in img.info:
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA"):
+        rgba = img.convert("RGBA")
+        rgb = PILImage.new("RGB", img.size, (255, 255, 255))
+        rgb.paste(rgba, mask=rgba.split()[3])
+        return rgb
+    return img.convert("RGB")
+
+
+def encode(img, fmt: str = "png", effort: str = "default") -> bytes:
+    buf = BytesIO()
+    flatten(img).save(buf, FORMATS[fmt][0], **SAVE_OPTIONS[(fmt, effort)])
+    return buf.getvalue()
+
+
+def normalize(source, fmt: str = "png", effort: str = "default",
+              max_dim: int | None = None, max_pixels: int | None = None,
+              verify: bool = False) -> bytes:
+    """Normalized image bytes for `source` (bytes or a path).
+
+    Returns the original bytes when the source already is an opaque image
+    in `fmt` within `max_dim`; `verify=True` still checks such a file for
+    corruption (cheap for PNG, which is CRC-checked without decoding).
+    Raises `ImageTooLarge` past `max_pixels` before decoding anything (the
+    decompression-bomb guard; Pillow's own process-wide limit is left alone).
+    """
+    with _open(source) as img, tracing.span("normalize", fmt=fmt) as sp:
+        w, h = img.size  # header only so far
+        sp.update(source=img.format, size=f"{w}x{h}")
+        if max_pixels and w * h > max_pixels:
+            raise ImageTooLarge(f"{w}x{h} exceeds the pixel cap")
+        sp["passthrough"] = is_passthrough(img, fmt, max_dim)
+        if sp["passthrough"]:
+            if verify:
+                img.verify()
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                return bytes(source)
+            return Path(source).read_bytes()
+        with tracing.span("decode", source=img.format):
+            img = decode(img, max_dim)
+        with tracing.span("encode", fmt=fmt, effort=effort) as enc:
+            data = encode(img, fmt, effort)
+            enc["bytes"] = len(data)
+        return data
+
+
+def file_digest(path: str | Path) -> str:
+    """SHA-256 of a file's contents, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_atomic(path: str | Path, data: bytes) -> None:
+    """Replace `path` with `data` via a temp file and rename.
+
+    Never writes into the existing file, so a hardlink or reflink to it
+    elsewhere keeps its content, and readers never see a partial file.
+    Missing parent directories are created.
+    """
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def save(source, path: str, fmt: str | None = None, effort: str = "default",
+         max_dim: int | None = None) -> None:
+    """Write `source` normalized to `path` (format from its suffix)."""
+    data = normalize(source, fmt or suffix_format(path), effort, max_dim)
+    write_atomic(path, data)
+
+
+# --- Renditions ---
+
+DEFAULT_VARIANTS = (480, 960, 1920)
+# Typst's default A4 page leaves a 160mm wide text column
+TEXT_WIDTH_IN = 160 / 25.4
+DEFAULT_DPI = 150
+UNITS_IN = {"in": 1.0, "cm": 1 / 2.54, "mm": 1 / 25.4, "pt": 1 / 72}
+
+
+def parse_widths(spec: str) -> list[int]:
+    """`"480,960"` -> [480, 960]."""
+    widths = sorted({int(w) for w in spec.split(",") if w.strip()})
+    if not widths or widths[0] <= 0:
+        raise ValueError(f"bad rendition widths '{spec}'")
+    return widths
+
+
+def rendition_path(path: str, width: int, fmt: str | None = None) -> str:
+    """`images/x.png` -> `images/x@480w.png` (suffix of `fmt` if given)."""
+    p = Path(path)
+    suffix = FORMATS[fmt][1] if fmt else p.suffix
+    return str(p.with_name(f"{p.stem}@{width}w{suffix}"))
+
+
+def renditions(source, widths: list[int], fmt: str = "png",
+               effort: str = "default") -> list[tuple[int, bytes]]:
+    """Encoded downscaled copies of `source` at each pixel width.
+
+    The source is decoded once, at the reduced scale the largest rendition
+    allows; each smaller one is resized from the previous rendition. Widths
+    that aren't below the source's own are skipped.
+    """
+    from PIL import Image as PILImage
+
+    with _open(source) as img:
+        w, h = img.size
+        widths = sorted({x for x in widths if x < w}, reverse=True)
+        if not widths:
+            return []
+        img = flatten(decode(img, -(-widths[0] * max(w, h) // w)))
+        out = []
+        for width in widths:
+            img = img.resize((width, max(1, round(h * width / w))),
+                             PILImage.Resampling.LANCZOS)
+            out.append((width, encode(img, fmt, effort)))
+    return out[::-1]
+
+
+def write_renditions(path: str, widths: list[int], fmt: str | None = None,
+                     effort: str = "default") -> list[tuple[int, str]]:
+    """Write renditions of the image at `path` next to it.
+
+    Returns `(width, path)` pairs, smallest first.
+    """
+    fmt = fmt or suffix_format(path)
+    written = []
+    for width, data in renditions(path, widths, fmt, effort):
+        out = rendition_path(path, width, fmt)
+        write_atomic(out, data)
+        written.append((width, out))
+    return written
+
+
+def make_renditions(paths: list[str], widths: list[int],
+                    fmt: str | None = None, effort: str = "default",
+                    jobs: int = 4) -> dict[str, list[tuple[int, str]]]:
+    """`write_renditions` for every path; several images use a process pool.
+
+    Decoding and resizing are CPU-bound and hold the GIL, so images are
+    spread across processes rather than threads.
+    """
+    if len(paths) < 2 or jobs < 2:
+        return {p: write_renditions(p, widths, fmt, effort) for p in paths}
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        futures = {p: pool.submit(write_renditions, p, widths, fmt, effort)
+                   for p in paths}
+        return {p: f.result() for p, f in futures.items()}
+
+
+def typst_length_in(width: str, text_width: float = TEXT_WIDTH_IN) -> float | None:
+    """Physical size of a Typst length like `80%` or `6cm`, in inches."""
+    m = re.fullmatch(r"\s*([\d.]+)\s*(%|in|cm|mm|pt)\s*", width)
+    if not m:
+        return None  # auto, fr, em...: can't tell
+    value, unit = float(m.group(1)), m.group(2)
+    if unit == "%":
+        return text_width * value / 100
+    return value * UNITS_IN[unit]
+
+
+def pick_rendition(path: str, available: list[tuple[int, str]], width: str,
+                   dpi: int = DEFAULT_DPI) -> str:
+    """Smallest rendition still at least `dpi` when shown at Typst `width`.
+
+    Falls back to the full-size image when none is large enough or the
+    width can't be converted to a physical size.
+    """
+    inches = typst_length_in(width)
+    if inches is None:
+        return path
+    for px, candidate in available:
+        if px >= inches * dpi:
+            return candidate
+    return path
+
+
+# --- Contact sheets ---
+
+SHEET_THUMB = 384
+SHEET_GAP = 8
+
+
+def contact_sheet(items: list[tuple[str, str]], path: str,
+                  thumb: int = SHEET_THUMB, effort: str = "default") -> None:
+    """Write a grid of `(label, image path)` thumbnails, labels drawn on top.
+
+    Each image is decoded at reduced scale (see `decode`) and only its
+    thumbnail is kept while the next one is read.
+    """
+    import math
+
+    from PIL import Image as PILImage
+    from PIL import ImageDraw, ImageFont
+
+    try:
+        font = ImageFont.load_default(size=max(12, thumb // 12))
+    except (TypeError, ImportError):  # Pillow < 10.1 or no FreeType
+        font = ImageFont.load_default()
+    cols = math.ceil(math.sqrt(len(items)))
+    rows = math.ceil(len(items) / cols)
+    cell = thumb + SHEET_GAP
+    sheet = PILImage.new("RGB", (cols * cell + SHEET_GAP,
+                                 rows * cell + SHEET_GAP), (255, 255, 255))
+    draw = ImageDraw.Draw(sheet)
+    for n, (label, source) in enumerate(items):
+        x = SHEET_GAP + (n % cols) * cell
+        y = SHEET_GAP + (n // cols) * cell
+        with _open(source) as img:
+            img = flatten(decode(img, thumb))
+            img.thumbnail((thumb, thumb), PILImage.Resampling.LANCZOS)
+            sheet.paste(img, (x + (thumb - img.width) // 2,
+                              y + (thumb - img.height) // 2))
+        box = draw.textbbox((x + 6, y + 4), label, font=font)
+        draw.rectangle((box[0] - 4, box[1] - 3, box[2] + 4, box[3] + 3),
+                       fill=(0, 0, 0))
+        draw.text((x + 6, y + 4), label, fill=(255, 255, 255), font=font)
+    fmt = suffix_format(path)
+    write_atomic(path, encode(sheet, fmt, effort))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Thin client for the resident skills worker (see worker.py).
+
+Usage:
+    python3 run.py image-search "golden gate bridge" --typst
+    python3 run.py nano-banana -p "description" --typst
+    python3 run.py typst-figures report.typ
+
+Forwards the arguments, working directory and the environment variables
+the scripts read to a running worker over its Unix socket and replays the
+job's stdout, stderr and exit code, so the output is exactly what the script
+itself would print. The socket is only used when it and its directory belong
+to the current user and nobody else can reach them. With no usable worker
+(or a stale one) it execs `uv run --script` on the script instead. Standard
+library only, so it starts in a few milliseconds.
+"""
+
+import json
+import os
+import socket
+import stat
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SCRIPTS = {
+    "image-search": ROOT / "image-search" / "scripts" / "image_search.py",
+    "nano-banana": ROOT / "nano-banana" / "scripts" / "gemini_imagen.py",
+    "typst-figures": ROOT / "shared" / "typst_figures.py",
+}
+
+# Environment the scripts (and httpx / google-genai under them) read; nothing
+# else is sent to the worker
+FORWARD_ENV = {"GEMINI_API_KEY", "GENAI_API_KEY", "SERPAPI_KEY",
+               "UNSPLASH_ACCESS_KEY", "PEXELS_API_KEY", "HOME",
+               "XDG_CACHE_HOME", "TMPDIR", "HTTP_PROXY", "HTTPS_PROXY",
+               "ALL_PROXY", "NO_PROXY", "http_proxy", "https_proxy",
+               "all_proxy", "no_proxy", "SSL_CERT_FILE", "SSL_CERT_DIR"}
+FORWARD_PREFIXES = ("IMAGE_SEARCH_", "NANO_BANANA_", "CLAUDE_SKILLS_",
+                    "GOOGLE_")
+
+
+def forwarded(name: str) -> bool:
+    return name in FORWARD_ENV or name.startswith(FORWARD_PREFIXES)
+
+
+def socket_path() -> Path:
+    """Worker socket (`$CLAUDE_SKILLS_WORKER` or a per-user runtime dir)."""
+    override = os.environ.get("CLAUDE_SKILLS_WORKER")
+    if override:
+        return Path(override)
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    base = Path(runtime) if runtime else Path(f"/tmp/claude-skills-{os.getuid()}")
+    return base / "claude-skills-worker.sock"
+
+
+def send(conn: socket.socket, msg: dict) -> None:
+    conn.sendall(json.dumps(msg).encode() + b"\n")
+
+
+def private_dir(path: Path) -> bool:
+    """Whether `path` is a real directory of ours that only we can use."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return (stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid()
+            and stat.S_IMODE(st.st_mode) == 0o700)
+
+
+def trusted_socket(path: Path) -> bool:
+    """Whether `path` is our own socket in a private directory.
+
+    Anything else (a symlink, another user's socket or directory, a
+    directory others can write to) could be a fake worker collecting the
+    API keys we forward.
+    """
+    if not private_dir(path.parent):
+        return False
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid()
+
+
+def connect(timeout: float | None = None) -> socket.socket | None:
+    """Connected worker socket, or None if no trusted worker is listening."""
+    if not trusted_socket(socket_path()):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(str(socket_path()))
+    except OSError:
+        conn.close()
+        return None
+    return conn
+
+
+def forward(skill: str, argv: list[str]) -> int | None:
+    """Run a job on the worker; exit code, or None to run it locally."""
+    conn = connect()
+    if conn is None:
+        return None
+    with conn:
+        send(conn, {"cmd": "run", "skill": skill, "argv": argv,
+                    "cwd": os.getcwd(),
+                    "env": {k: v for k, v in os.environ.items()
+                            if forwarded(k)}})
+        streams = {1: sys.stdout, 2: sys.stderr}
+        started = False
+        for line in conn.makefile("r", encoding="utf-8"):
+            msg = json.loads(line)
+            if "data" in msg:
+                started = True
+                streams[msg["fd"]].write(msg["data"])
+                streams[msg["fd"]].flush()
+            elif msg.get("stale"):
+                return None
+            elif "exit" in msg:
+                return msg["exit"]
+    # The worker went away mid-job; only rerun locally if nothing was printed
+    return 1 if started else None
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in SCRIPTS:
+        print(f"usage: run.py {{{','.join(SCRIPTS)}}} [args...]",
+              file=sys.stderr)
+        sys.exit(2)
+    skill, argv = sys.argv[1], sys.argv[2:]
+    code = forward(skill, argv)
+    if code is not None:
+        sys.exit(code)
+    script = str(SCRIPTS[skill])
+    try:
+        os.execvp("uv", ["uv", "run", "--script", script, *argv])
+    except OSError as e:
+        print(f"Error: could not run {script} with uv: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
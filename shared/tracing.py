@@ -0,0 +1,288 @@
+"""
+Structured timing spans and profiling hooks for the image skills.
+
+With `--trace PATH` (or `CLAUDE_SKILLS_TRACE=PATH`) every phase of a run --
+startup, provider searches, DNS, connect/TLS, request and body transfer,
+candidate downloads, PIL decode and encode, the Gemini round trip -- is
+recorded as a span with start/end time, outcome and attributes such as
+bytes or status. A `.json` path is written in Chrome trace-event format (open
+it in chrome://tracing or ui.perfetto.dev); anything else gets one JSON
+object per span (JSON lines). Spans from concurrent asyncio tasks and
+threads land on separate lanes.
+
+`--profile cprofile|tracemalloc` (or `CLAUDE_SKILLS_PROFILE`) additionally
+wraps the hot entry points decorated with `profiled`: cProfile stats are
+saved to `<name>.prof` and summarized on stderr, tracemalloc reports the
+peak and the top allocation sites.
+
+With tracing off, `span()` costs a dict and a generator; nothing is stored.
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+TRACE_ENV = "CLAUDE_SKILLS_TRACE"
+PROFILE_ENV = "CLAUDE_SKILLS_PROFILE"
+PROFILERS = ("cprofile", "tracemalloc")
+
+_IMPORTED = time.perf_counter()
+_tracer = None
+_profile: str | None = None
+
+
+def _process_age() -> float | None:
+    """Seconds since this process started (Linux only)."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesized command name; starttime is #22
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        return (time.clock_gettime(time.CLOCK_BOOTTIME)
+                - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class Tracer:
+    """Collects finished spans and writes them out in `finish()`."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.chrome = self.path.suffix == ".json"
+        self.spans: list[dict] = []
+        self.lanes: dict = {}
+        self.lock = threading.Lock()
+        # perf_counter for durations, anchored to wall time for readability
+        self.origin = time.perf_counter()
+        self.epoch = time.time()
+
+    def lane(self) -> int:
+        """Small id for the current asyncio task, or else thread."""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = (("task", id(task)) if task is not None
+               else ("thread", threading.get_ident()))
+        with self.lock:
+            if key not in self.lanes:
+                label = (task.get_name() if task is not None
+                         else threading.current_thread().name)
+                self.lanes[key] = (len(self.lanes) + 1, label)
+            return self.lanes[key][0]
+
+    def record(self, name: str, start: float, end: float, attrs: dict,
+               outcome: str = "ok", lane: int | None = None) -> None:
+        span = {"name": name, "start": start, "end": end,
+                "lane": lane if lane is not None else self.lane(),
+                "outcome": outcome, **attrs}
+        with self.lock:
+            self.spans.append(span)
+
+    def wall(self, t: float) -> float:
+        return self.epoch + (t - self.origin)
+
+    def write(self) -> None:
+        spans = sorted(self.spans, key=lambda s: s["start"])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            if self.chrome:
+                pid = os.getpid()
+                events = [{"name": "thread_name", "ph": "M", "pid": pid,
+                           "tid": lane, "args": {"name": label}}
+                          for lane, label in self.lanes.values()]
+                for s in spans:
+                    args = {k: v for k, v in s.items()
+                            if k not in ("name", "start", "end", "lane")}
+                    events.append({
+                        "name": s["name"], "cat": s["name"].split(".")[0],
+                        "ph": "X", "pid": pid, "tid": s["lane"],
+                        "ts": round(self.wall(s["start"]) * 1e6),
+                        "dur": round((s["end"] - s["start"]) * 1e6),
+                        "args": args})
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"},
+                          f, default=str)
+            else:
+                for s in spans:
+                    line = {**s, "start": round(self.wall(s["start"]), 6),
+                            "end": round(self.wall(s["end"]), 6),
+                            "ms": round((s["end"] - s["start"]) * 1000, 3)}
+                    f.write(json.dumps(line, default=str) + "\n")
+
+
+def configure(path: str | None = None, profile: str | None = None) -> None:
+    """Start a trace session (flags win over the environment).
+
+    Also records the process startup (interpreter and imports) as the first
+    span.
+    """
+    global _tracer, _profile
+    path = path or os.environ.get(TRACE_ENV) or None
+    profile = profile or os.environ.get(PROFILE_ENV) or None
+    if profile not in (None, *PROFILERS):
+        print(f"Ignoring unknown profiler '{profile}'", file=sys.stderr)
+        profile = None
+    _profile = profile
+    _tracer = Tracer(path) if path else None
+    if _tracer is not None:
+        now = time.perf_counter()
+        age = _process_age()
+        start = now - age if age is not None and age < 3600 else _IMPORTED
+        _tracer.record("startup", start, now, {"argv": sys.argv[1:]})
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def finish() -> None:
+    """Write the trace (if any) and end the session."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return
+    try:
+        tracer.write()
+        print(f"Trace: {tracer.path} ({len(tracer.spans)} spans)",
+              file=sys.stderr)
+    except OSError as e:
+        print(f"Could not write trace {tracer.path}: {e}", file=sys.stderr)
+
+
+@contextmanager
+def session(path: str | None = None, profile: str | None = None):
+    """`configure()` ... `finish()` around a whole run, as one `main` span."""
+    configure(path, profile)
+    try:
+        with span("main"):
+            yield
+    finally:
+        finish()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as span `name`; yields `attrs` to add results to.
+
+    An exception escaping the block marks the span's outcome as an error.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield attrs
+        return
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield attrs
+    except BaseException as e:
+        outcome = f"error: {type(e).__name__}: {e}"
+        raise
+    finally:
+        tracer.record(name, start, time.perf_counter(), attrs, outcome)
+
+
+# --- httpcore phases ---
+
+def _phase_recorder(tracer: Tracer, url: str):
+    """Turn httpcore `<phase>.started/complete/failed` events into spans."""
+    started: dict[str, tuple[float, int]] = {}
+
+    def on_event(name: str, info: dict) -> None:
+        phase, _, stage = name.rpartition(".")
+        now = time.perf_counter()
+        if stage == "started":
+            started[phase] = (now, tracer.lane())
+            return
+        begun = started.pop(phase, None)
+        if begun is None:
+            return
+        outcome = "ok"
+        if stage == "failed":
+            exc = info.get("exception")
+            outcome = f"error: {type(exc).__name__}: {exc}"
+        tracer.record(f"http.{phase}", begun[0], now, {"url": url}, outcome,
+                      lane=begun[1])
+
+    return on_event
+
+
+def http_trace_extension(url: str, is_async: bool):
+    """Value for an httpx request's `trace` extension, or None if off."""
+    tracer = _tracer
+    if tracer is None:
+        return None
+    on_event = _phase_recorder(tracer, url)
+    if not is_async:
+        return on_event
+
+    async def on_event_async(name: str, info: dict) -> None:
+        on_event(name, info)
+
+    return on_event_async
+
+
+# --- Profiling hooks ---
+
+@contextmanager
+def _profiling(name: str):
+    if _profile == "cprofile":
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            out = (_tracer.path.parent if _tracer else Path.cwd()) / f"{name}.prof"
+            try:
+                profiler.dump_stats(out)
+                print(f"Profile: {out}", file=sys.stderr)
+            except OSError:
+                pass
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+                "cumulative").print_stats(15)
+    elif _profile == "tracemalloc":
+        import tracemalloc
+
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            if not was_tracing:
+                tracemalloc.stop()
+            print(f"{name}: peak {peak / 2**20:.1f} MB traced, "
+                  f"{current / 2**20:.1f} MB still allocated", file=sys.stderr)
+            for stat in top:
+                print(f"  {stat}", file=sys.stderr)
+    else:
+        yield
+
+
+def profiled(fn):
+    """Run `fn` (sync or async) under the selected profiler, as a span."""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with _profiling(fn.__name__), span(fn.__name__):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _profiling(fn.__name__), span(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
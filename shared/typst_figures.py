@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "google-genai>=1.0.0",
+#     "ddgs>=7.0.0",
+#     "pillow>=10.0.0",
+#     "httpx[http2]>=0.27.0",
+#     "numpy>=1.24",
+# ]
+# ///
+"""
+Resolve every image placeholder in a Typst document in one run.
+
+Usage:
+    uv run --script typst_figures.py report.typ
+    uv run --script typst_figures.py report.typ --check
+
+A placeholder is a `// @image` comment naming how to get the image, followed
+by the `image("...")` call that shows it:
+
+    // @image logo Stripe width=30%
+    // @image search "golden gate bridge" size=large aspect=16:9
+    // @image stock "office meeting"
+    // @image url https://example.com/chart.png caption="Q3 revenue"
+    // @image generate "three-legged stool for risk parity" resolution=2K
+    #figure(image("images/stool.png", width: 80%), caption: [...])
+
+When no `image("...")` call follows the directive (before the next blank
+line), a `#figure` with an auto-named path under `--dir` is inserted into the
+document. All placeholders are then fetched or generated concurrently, and
+`<document>.lock` records a hash of each directive with the file it produced,
+so later runs only touch placeholders that are new, edited or whose file is
+missing.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import shlex
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from image_io import slugify, write_atomic
+from run import SCRIPTS
+
+DIRECTIVE_RE = re.compile(r"^(\s*)//\s*@image\s+(.*)$")
+IMAGE_RE = re.compile(r'image\(\s*"([^"]+)"')
+KINDS = ("search", "logo", "stock", "url", "generate")
+# Options that only change the Typst markup, not the image itself
+MARKUP_OPTIONS = {"width", "caption"}
+SEARCH_OPTIONS = {"size", "type", "aspect", "domain", "dup_threshold"}
+GENERATE_OPTIONS = {"model", "resolution", "aspect", "input", "seed",
+                    "variant"}
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+LOCK_VERSION = 1
+
+
+@dataclass
+class Placeholder:
+    """One `// @image` directive and the image path it fills."""
+
+    line: int  # index of the directive line
+    indent: str
+    kind: str
+    query: str
+    options: dict = field(default_factory=dict)
+    output: str | None = None  # as written in the document
+
+    @property
+    def key(self) -> str:
+        """Hash of everything that decides which image ends up in `output`."""
+        spec = {"kind": self.kind, "query": self.query, "output": self.output,
+                "options": {k: v for k, v in self.options.items()
+                            if k not in MARKUP_OPTIONS}}
+        return hashlib.sha256(
+            json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+    @property
+    def label(self) -> str:
+        return f"{self.kind}: {self.query}"
+
+
+def parse_directive(text: str) -> tuple[str, str, dict]:
+    """`logo Stripe width=30%` -> ("logo", "Stripe", {"width": "30%"})."""
+    tokens = shlex.split(text)
+    if not tokens or tokens[0] not in KINDS:
+        raise ValueError(f"directive must start with one of {', '.join(KINDS)}")
+    kind, words, options = tokens[0], [], {}
+    for token in tokens[1:]:
+        name, eq, value = token.partition("=")
+        if eq and re.fullmatch(r"[a-z_]+", name):
+            options[name] = value
+        else:
+            words.append(token)
+    if not words:
+        raise ValueError(f"'{kind}' directive needs a query")
+    return kind, " ".join(words), options
+
+
+def scan(lines: list[str]) -> list[Placeholder]:
+    """Every placeholder in the document, in order.
+
+    The image path is taken from the first `image("...")` call after the
+    directive, up to the next blank line or directive.
+    """
+    found = []
+    for i, line in enumerate(lines):
+        m = DIRECTIVE_RE.match(line)
+        if not m:
+            continue
+        try:
+            kind, query, options = parse_directive(m.group(2))
+        except ValueError as e:
+            raise ValueError(f"line {i + 1}: {e}") from None
+        ph = Placeholder(i, m.group(1), kind, query, options)
+        for follow in lines[i + 1:]:
+            if not follow.strip() or DIRECTIVE_RE.match(follow):
+                break
+            image = IMAGE_RE.search(follow)
+            if image:
+                ph.output = image.group(1)
+                break
+        found.append(ph)
+    return found
+
+
+def caption_for(ph: Placeholder) -> str:
+    if "caption" in ph.options:
+        return ph.options["caption"]
+    text = Path(ph.query).stem if ph.kind == "url" else ph.query
+    return slugify(text, 60).replace("-", " ").title()
+
+
+def fill_outputs(placeholders: list[Placeholder], out_dir: str,
+                 base: Path) -> list[Placeholder]:
+    """Give path-less placeholders a unique auto-named path; returns them.
+
+    Paths used by other placeholders or already present on disk (relative to
+    the document directory `base`) are skipped, so nothing is overwritten.
+    """
+    taken = {ph.output for ph in placeholders if ph.output}
+    filled = []
+    for ph in placeholders:
+        if ph.output:
+            continue
+        text = Path(ph.query).stem if ph.kind == "url" else ph.query
+        suffix = "-logo" if ph.kind == "logo" else ""
+        ext = EXTENSIONS.get(ph.options.get("format", "png"), ".png")
+        stem = f"{out_dir}/{slugify(text) or 'image'}{suffix}"
+        path, n = f"{stem}{ext}", 2
+        while path in taken or (base / path).exists():
+            path, n = f"{stem}-{n}{ext}", n + 1
+        taken.add(path)
+        ph.output = path
+        filled.append(ph)
+    return filled
+
+
+def insert_figures(lines: list[str], filled: list[Placeholder]) -> list[str]:
+    """Document lines with a `#figure` added under each filled directive."""
+    lines = list(lines)
+    for ph in sorted(filled, key=lambda p: p.line, reverse=True):
+        width = ph.options.get("width", "80%")
+        pad = ph.indent
+        lines[ph.line + 1:ph.line + 1] = [
+            f"{pad}#figure(\n",
+            f'{pad}  image("{ph.output}", width: {width}),\n',
+            f"{pad}  caption: [{caption_for(ph)}],\n",
+            f"{pad})\n",
+        ]
+    return lines
+
+
+def lock_path(doc: Path) -> Path:
+    return doc.with_name(doc.name + ".lock")
+
+
+def load_lock(doc: Path) -> dict:
+    try:
+        lock = json.loads(lock_path(doc).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if lock.get("version") != LOCK_VERSION:
+        return {}
+    return lock.get("figures", {})
+
+
+def is_current(ph: Placeholder, lock: dict, base: Path) -> bool:
+    entry = lock.get(ph.key)
+    return (entry is not None and entry.get("output") == ph.output
+            and (base / ph.output).exists())
+
+
+async def resolve_one(ph: Placeholder, base: Path, client) -> str:
+    """Fetch or generate the image for `ph`; returns the saved path."""
+    path = base / ph.output
+    opts = ph.options
+    if ph.kind == "generate":
+        import gemini_imagen
+
+        kwargs = {"num_images": 1, "concurrency": 1}
+        if "model" in opts:
+            kwargs["model"] = opts["model"]
+        if "resolution" in opts:
+            kwargs["resolution"] = opts["resolution"].upper()
+        if "aspect" in opts:
+            kwargs["aspect_ratio"] = opts["aspect"]
+        if "input" in opts:
+            kwargs["input_images"] = [str(base / p)
+                                      for p in opts["input"].split(",")]
+        for name in ("seed", "variant"):
+            if name in opts:
+                kwargs[name] = int(opts[name])
+        try:
+            saved = await gemini_imagen.generate_image_async(
+                ph.query, str(path), **kwargs)
+        except SystemExit:
+            raise RuntimeError("GEMINI_API_KEY not set") from None
+    else:
+        import image_search
+
+        req = {"mode": ph.kind, "query": ph.query, "output": str(path),
+               "num": 1, "format": opts.get("format")}
+        if ph.kind == "url":
+            req["url"], req["query"] = ph.query, caption_for(ph)
+        req.update({k: v for k, v in opts.items() if k in SEARCH_OPTIONS})
+        saved = await image_search.run_request(req, client)
+    if not saved:
+        raise RuntimeError("nothing saved")
+    return saved[0]
+
+
+async def resolve_all(placeholders: list[Placeholder], base: Path,
+                      jobs: int = 4) -> dict[str, str | None]:
+    """Resolve `placeholders` `jobs` at a time; key -> error (None if ok)."""
+    sem = asyncio.Semaphore(max(1, jobs))
+    client = None
+    if any(ph.kind != "generate" for ph in placeholders):
+        import image_search
+        client = image_search.new_async_client()
+
+    async def one(ph: Placeholder) -> str | None:
+        async with sem:
+            print(f"Resolving {ph.output} ({ph.label})...", file=sys.stderr)
+            try:
+                await resolve_one(ph, base, client)
+            except Exception as e:
+                return str(e) or type(e).__name__
+        return None
+
+    try:
+        errors = await asyncio.gather(*(one(ph) for ph in placeholders))
+    finally:
+        if client is not None:
+            await client.aclose()
+    return {ph.key: err for ph, err in zip(placeholders, errors)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resolve every // @image placeholder in a Typst document.",
+    )
+    parser.add_argument("document", help="Typst file to scan")
+    parser.add_argument("--dir", "-d", default="images",
+                        help="Directory (relative to the document) for "
+                             "placeholders without an image path "
+                             "(default: images)")
+    parser.add_argument("--jobs", type=int, default=4,
+                        help="Placeholders resolved at once (default: 4)")
+    parser.add_argument("--check", action="store_true",
+                        help="List placeholders that need resolving, change "
+                             "nothing; exit 1 if there are any")
+    args = parser.parse_args()
+
+    for path in SCRIPTS.values():
+        if str(path.parent) not in sys.path:
+            sys.path.insert(0, str(path.parent))
+
+    doc = Path(args.document)
+    try:
+        lines = doc.read_text(encoding="utf-8").splitlines(keepends=True)
+        placeholders = scan(lines)
+    except (OSError, ValueError) as e:
+        print(f"Error: {doc}: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not placeholders:
+        print(f"No // @image placeholders in {doc}")
+        return
+
+    base = doc.parent
+    lock = load_lock(doc)
+    filled = fill_outputs(placeholders, args.dir.rstrip("/"), base)
+    unique = list({ph.key: ph for ph in placeholders}.values())
+    pending = [ph for ph in unique if not is_current(ph, lock, base)]
+
+    if args.check:
+        for ph in pending:
+            print(f"Pending: {ph.output} ({ph.label})")
+        print(f"{len(pending)} of {len(unique)} placeholders need resolving")
+        if pending:
+            sys.exit(1)
+        return
+
+    if filled:
+        write_atomic(doc, "".join(insert_figures(lines, filled)).encode())
+        print(f"Inserted {len(filled)} figure(s) into {doc}")
+
+    started = time.time()
+    errors = asyncio.run(resolve_all(pending, base, args.jobs))
+
+    figures = {}
+    for ph in unique:
+        if ph in pending and errors[ph.key] is not None:
+            print(f"Failed: {ph.output} ({ph.label}): {errors[ph.key]}")
+            continue
+        if ph in pending:
+            print(f"Resolved: {ph.output} ({ph.label})")
+            entry = {"resolved": time.time()}
+        else:
+            entry = {"resolved": lock[ph.key].get("resolved")}
+        figures[ph.key] = {"output": ph.output, "kind": ph.kind,
+                           "query": ph.query, **entry}
+    lock_text = json.dumps({"version": LOCK_VERSION, "figures": figures},
+                           indent=2) + "\n"
+    write_atomic(lock_path(doc), lock_text.encode())
+
+    failed = sum(err is not None for err in errors.values())
+    print(f"\n{len(pending) - failed} resolved, "
+          f"{len(unique) - len(pending)} up to date, {failed} failed "
+          f"({time.time() - started:.1f}s)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#     "google-genai>=1.0.0",
+#     "ddgs>=7.0.0",
+#     "pillow>=10.0.0",
+#     "httpx[http2]>=0.27.0",
+#     "numpy>=1.24",
+# ]
+# ///
+"""
+Resident worker for the image skills.
+
+Usage:
+    uv run --script worker.py start     # detach and serve in the background
+    uv run --script worker.py status
+    uv run --script worker.py stop
+    uv run --script worker.py serve     # serve in the foreground
+
+Keeps `image_search.py`, `gemini_imagen.py` and `typst_figures.py` imported
+together with their heavy dependencies (google-genai, ddgs, PIL, httpx,
+NumPy) and module-level clients, and runs jobs sent by run.py over a Unix socket. Each
+job is the script's own `main()` with the client's argv, working directory
+and environment, its stdout/stderr relayed back as it is written. Jobs run
+one at a time since they share process-wide state (cwd, environment, the
+scripts' globals). The worker exits after an idle timeout, and reports
+itself stale (so clients run the script directly) once any of the script
+files changes on disk.
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from run import (SCRIPTS, connect, forwarded, private_dir, send,
+                 socket_path)
+
+MODULES = {"image-search": "image_search", "nano-banana": "gemini_imagen",
+           "typst-figures": "typst_figures"}
+WARM_IMPORTS = ("httpx", "h2", "numpy", "PIL.Image", "ddgs",
+                "duckduckgo_search", "google.genai", "google.genai.types")
+DEFAULT_IDLE = 30 * 60
+
+
+def source_mtimes() -> dict[str, float]:
+    """Modification times of every module the worker has loaded from here."""
+    dirs = [Path(__file__).parent] + [p.parent for p in SCRIPTS.values()]
+    return {str(f): f.stat().st_mtime for d in dirs for f in d.glob("*.py")}
+
+
+class _Relay(io.TextIOBase):
+    """Text stream that forwards writes to the client as `{fd, data}`."""
+
+    encoding = "utf-8"
+
+    def __init__(self, conn, fd: int):
+        self.conn = conn
+        self.fd = fd
+        self.closed_by_peer = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if s and not self.closed_by_peer:
+            try:
+                send(self.conn, {"fd": self.fd, "data": s})
+            except OSError:
+                self.closed_by_peer = True  # finish the job regardless
+        return len(s)
+
+
+class Worker:
+    def __init__(self, idle: float = DEFAULT_IDLE):
+        self.idle = idle
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.started = time.time()
+        self.last_used = time.time()
+        self.modules = {}
+        self.mtimes: dict[str, float] = {}
+        self.server = None
+
+    def warm(self) -> None:
+        """Import the scripts and their heavy dependencies up front."""
+        for path in SCRIPTS.values():
+            sys.path.insert(0, str(path.parent))
+        for name in WARM_IMPORTS:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+        for skill, module in MODULES.items():
+            self.modules[skill] = importlib.import_module(module)
+        self.mtimes = source_mtimes()
+
+    def stale(self) -> bool:
+        try:
+            return source_mtimes() != self.mtimes
+        except OSError:
+            return True
+
+    def run(self, conn, msg: dict) -> None:
+        """Run one job with the client's argv, cwd, env and stdio."""
+        with self.lock:
+            if self.stale():
+                send(conn, {"stale": True})
+                threading.Thread(target=self.server.shutdown).start()
+                return
+            self.jobs += 1
+            out, err = _Relay(conn, 1), _Relay(conn, 2)
+            saved = (sys.argv, sys.stdout, sys.stderr, os.getcwd(),
+                     dict(os.environ))
+            code = 0
+            try:
+                os.chdir(msg["cwd"])
+                # The client only sends what the scripts read; drop the
+                # worker's own values of those so an unset key stays unset
+                for name in [k for k in os.environ if forwarded(k)]:
+                    del os.environ[name]
+                os.environ.update({k: v for k, v in msg["env"].items()
+                                   if forwarded(k)})
+                sys.argv = [str(SCRIPTS[msg["skill"]])] + msg["argv"]
+                sys.stdout, sys.stderr = out, err
+                self.modules[msg["skill"]].main()
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    code = e.code or 0
+                else:  # sys.exit("message")
+                    print(e.code, file=sys.stderr)
+                    code = 1
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.argv, sys.stdout, sys.stderr = saved[:3]
+                os.chdir(saved[3])
+                os.environ.clear()
+                os.environ.update(saved[4])
+                self.last_used = time.time()
+            try:
+                send(conn, {"exit": code})
+            except OSError:
+                pass
+
+    def handle(self, conn) -> None:
+        line = conn.makefile("r", encoding="utf-8").readline()
+        if not line:
+            return
+        msg = json.loads(line)
+        cmd = msg.get("cmd")
+        if cmd == "run" and msg.get("skill") in self.modules:
+            self.run(conn, msg)
+        elif cmd == "status":
+            send(conn, {"pid": os.getpid(), "jobs": self.jobs,
+                        "uptime": round(time.time() - self.started),
+                        "busy": self.lock.locked()})
+        elif cmd == "stop":
+            send(conn, {"ok": True})
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            send(conn, {"error": f"unknown request {cmd!r}"})
+
+    def watch_idle(self) -> None:
+        while True:
+            time.sleep(min(60, self.idle))
+            if (not self.lock.locked()
+                    and time.time() - self.last_used > self.idle):
+                self.server.shutdown()
+                return
+
+    def serve(self) -> None:
+        path = socket_path()
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if not private_dir(path.parent):
+            print(f"Error: {path.parent} must be a directory owned by you "
+                  f"with mode 0700 (not a symlink).", file=sys.stderr)
+            sys.exit(1)
+        probe = connect(timeout=1)
+        if probe is not None:
+            probe.close()
+            print("Error: a worker is already running.", file=sys.stderr)
+            sys.exit(1)
+        path.unlink(missing_ok=True)  # left behind by a dead worker
+        self.warm()
+
+        worker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                worker.handle(self.request)
+
+        self.server = socketserver.ThreadingUnixStreamServer(str(path),
+                                                             Handler)
+        self.server.daemon_threads = True
+        os.chmod(path, 0o600)
+        threading.Thread(target=self.watch_idle, daemon=True).start()
+        print(f"Worker {os.getpid()} listening on {path}", file=sys.stderr)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            path.unlink(missing_ok=True)
+
+
+def request(msg: dict) -> dict | None:
+    conn = connect(timeout=5)
+    if conn is None:
+        return None
+    with conn:
+        send(conn, msg)
+        line = conn.makefile("r", encoding="utf-8").readline()
+    return json.loads(line) if line else None
+
+
+def start(idle: float) -> None:
+    if request({"cmd": "status"}):
+        print(f"Worker already running on {socket_path()}")
+        return
+    log = socket_path().with_suffix(".log")
+    log.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not private_dir(log.parent):
+        print(f"Error: {log.parent} must be a directory owned by you "
+              f"with mode 0700 (not a symlink).", file=sys.stderr)
+        sys.exit(1)
+    with open(log, "ab") as f:
+        subprocess.Popen([sys.executable, __file__, "serve",
+                          "--idle", str(idle)],
+                         stdin=subprocess.DEVNULL, stdout=f, stderr=f,
+                         start_new_session=True)
+    deadline = time.time() + 60  # first start imports everything
+    while time.time() < deadline:
+        status = request({"cmd": "status"})
+        if status:
+            print(f"Worker {status['pid']} running on {socket_path()}")
+            return
+        time.sleep(0.1)
+    print(f"Error: worker did not start, see {log}", file=sys.stderr)
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Resident worker for the image skills.",
+    )
+    parser.add_argument("command", choices=["start", "serve", "status", "stop"])
+    parser.add_argument("--idle", type=float, default=DEFAULT_IDLE,
+                        help="Exit after this many idle seconds (default: 1800)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        Worker(args.idle).serve()
+    elif args.command == "start":
+        start(args.idle)
+    elif args.command == "status":
+        status = request({"cmd": "status"})
+        if not status:
+            print("No worker running")
+            sys.exit(1)
+        print(f"Worker {status['pid']}: {status['jobs']} jobs, "
+              f"up {status['uptime']}s{', busy' if status['busy'] else ''}")
+    else:
+        print("Stopped" if request({"cmd": "stop"}) else "No worker running")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""Put the skills' script directories on sys.path, as the scripts do."""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+for d in ("shared", "image-search/scripts", "nano-banana/scripts"):
+    if str(ROOT / d) not in sys.path:
+        sys.path.insert(0, str(ROOT / d))
@@ -0,0 +1,28 @@
+from PIL import Image
+
+from dedup import HashSet, dhash, dhash_file
+
+
+def gradient(size=(256, 192)):
+    img = Image.new("RGB", size)
+    img.putdata([(x % 256, y % 256, (x + y) % 256)
+                 for y in range(size[1]) for x in range(size[0])])
+    return img
+
+
+def test_dhash_palette_image(tmp_path):
+    rgb = gradient()
+    path = tmp_path / "p.png"
+    rgb.convert("P").save(path)
+    with Image.open(path) as img:
+        assert img.mode == "P"
+    h = dhash_file(path)
+    # Same picture as the RGB original, give or take palette rounding
+    seen = HashSet(6)
+    seen.add(dhash(rgb), "rgb")
+    assert seen.find(h) == "rgb"
+
+
+def test_dhash_bilevel_and_16_bit_images():
+    assert isinstance(dhash(gradient().convert("1")), int)
+    assert isinstance(dhash(Image.new("I;16", (256, 192))), int)
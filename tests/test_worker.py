@@ -0,0 +1,52 @@
+import json
+import socket
+import sys
+import threading
+from pathlib import Path
+
+import image_search
+from worker import Worker, source_mtimes
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "bench"))
+from mock_services import MockServices  # noqa: E402
+
+
+def run_job(worker: Worker, argv: list[str], env: dict, cwd: Path):
+    """(exit code, stderr) of one job run the way a client would send it."""
+    ours, theirs = socket.socketpair()
+    msg = {"cmd": "run", "skill": "image-search", "argv": argv,
+           "cwd": str(cwd), "env": env}
+    job = threading.Thread(target=worker.run, args=(theirs, msg))
+    job.start()
+    err = []
+    with ours, ours.makefile("r", encoding="utf-8") as f:
+        for line in f:
+            reply = json.loads(line)
+            if "exit" in reply:
+                break
+            if reply.get("fd") == 2:
+                err.append(reply["data"])
+    job.join()
+    theirs.close()
+    return reply["exit"], "".join(err)
+
+
+def test_flags_do_not_leak_into_the_next_job(tmp_path):
+    mock = MockServices().start()
+    try:
+        worker = Worker()
+        worker.modules = {"image-search": image_search}
+        worker.mtimes = source_mtimes()
+        env = {**mock.env(), "SERPAPI_KEY": "x",
+               "XDG_CACHE_HOME": str(tmp_path / "cache")}
+
+        code, err = run_job(worker, ["cat", "--max-mb", "0.001"], env,
+                            tmp_path)
+        assert code == 1 and "size cap" in err
+
+        code, err = run_job(worker, ["cat", "--no-cache"], env, tmp_path)
+        assert code == 0, err
+        assert image_search.MAX_BYTES == image_search.DEFAULT_MAX_BYTES
+        assert len(list((tmp_path / "images").iterdir())) == 1
+    finally:
+        mock.stop()